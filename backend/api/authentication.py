@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.cache import count
+from users.models import User
+
+# Попадания в память процесса сбрасываются в общий счётчик пачками
+HITS_FLUSH = 100
+# Поля пользователя в кэше токенов: проверка прав и профиль /users/me/
+# без запросов; хеш пароля и счётчики в кэш не попадают
+# (в порядке полей модели, как ожидает from_db)
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in (
+        'id', 'email', 'username', 'first_name', 'last_name', 'is_active',
+        'is_staff'))
+
+
+class TokenCache:
+    '''Токены с пользователями: LRU в памяти процесса поверх кэша Django.
+
+    Запись в памяти живёт AUTH_TOKEN_LOCAL_TIMEOUT секунд (по умолчанию
+    0 - без неё) - столько другой воркер может принимать уже отозванный
+    токен. Запись в кэше Django живёт AUTH_TOKEN_CACHE_TIMEOUT и
+    удаляется сигналами, поэтому отзыв сразу виден всем воркерам только
+    с общим бэкендом кэша. Хранится только USER_FIELDS пользователя:
+    из них на каждый запрос собираются новые объекты, а остальные поля
+    загружаются из БД при первом обращении.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+
+    @staticmethod
+    def get_cache_key(key):
+        return f'auth:snapshot:{sha256(key.encode()).hexdigest()}'
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                hits = self.hits if self.hits >= HITS_FLUSH else 0
+                if hits:
+                    self.hits = 0
+                data = entry[1]
+            else:
+                data = None
+        if data is None:
+            data = cache.get(self.get_cache_key(key))
+            count('auth', 'misses' if data is None else 'hits')
+            if data is None:
+                return None
+            self.remember(key, data)
+        elif hits:
+            count('auth', 'hits', hits)
+        return self.load(key, data)
+
+    @staticmethod
+    def dump(token):
+        return (token.created, *(
+            getattr(token.user, field) for field in USER_FIELDS))
+
+    @staticmethod
+    def load(key, data):
+        created, *values = data
+        user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, values)
+        token = Token.from_db(
+            DEFAULT_DB_ALIAS, ('key', 'user_id', 'created'),
+            (key, user.pk, created))
+        token.user = user
+        return token
+
+    def remember(self, key, data):
+        if settings.AUTH_TOKEN_LOCAL_TIMEOUT <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (
+                monotonic() + settings.AUTH_TOKEN_LOCAL_TIMEOUT, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_TOKEN_LOCAL_SIZE:
+                self.entries.popitem(last=False)
+
+    def set(self, key, token):
+        data = self.dump(token)
+        cache.set(
+            self.get_cache_key(key), data, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        self.remember(key, data)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        cache.delete(self.get_cache_key(key))
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''TokenAuthentication без запроса к БД для недавно виденных токенов.
+
+    При AUTH_TOKEN_CACHE_TIMEOUT = 0 работает как TokenAuthentication.
+    '''
+
+    def authenticate_credentials(self, key):
+        if settings.AUTH_TOKEN_CACHE_TIMEOUT <= 0:
+            return super().authenticate_credentials(key)
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+            return user, token
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
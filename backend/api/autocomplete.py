@@ -0,0 +1,91 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from api.cache import get_version
+from foodgram.models import Ingredient
+
+# Подсказок по умолчанию и не больше чем
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def get_limit(request):
+    '''Число подсказок из параметра limit'''
+    try:
+        limit = int(request.query_params.get('limit'))
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+class IngredientIndex:
+    '''Префиксный индекс названий ингредиентов в памяти процесса.
+
+    Хранит отсортированные названия в нижнем регистре вместе с
+    ингредиентами и перестраивается, когда сигналы меняют версию кэша
+    ингредиентов. Подсказки отдаются без запроса к БД.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        self.rows = ((), ())
+
+    def refresh(self):
+        version = get_version('ingredients')
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            rows = sorted(
+                (name.lower(), pk, name, measurement_unit)
+                for pk, name, measurement_unit
+                in Ingredient.objects.values_list(
+                    'pk', 'name', 'measurement_unit'))
+            self.rows = (
+                tuple(row[0] for row in rows),
+                tuple(row[1:] for row in rows))
+            self.version = version
+
+    def search(self, value, limit=DEFAULT_LIMIT):
+        '''Ингредиенты: сначала совпадения по началу, затем по подстроке'''
+        self.refresh()
+        names, ingredients = self.rows
+        value = value.lower()
+        found = []
+        start = position = bisect_left(names, value)
+        while position < len(names) and names[position].startswith(value):
+            found.append(ingredients[position])
+            if len(found) == limit:
+                return self.to_representation(found)
+            position += 1
+        for index, name in enumerate(names):
+            if start <= index < position:
+                continue
+            if value in name:
+                found.append(ingredients[index])
+                if len(found) == limit:
+                    break
+        return self.to_representation(found)
+
+    def to_representation(self, found):
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in found]
+
+
+ingredient_index = IngredientIndex()
+
+
+class IngredientSearchMixin:
+    '''list с параметром name отдаёт подсказки из индекса'''
+
+    def list(self, request, *args, **kwargs):
+        value = request.query_params.get('name')
+        if not value or not settings.INGREDIENT_INDEX:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(value, get_limit(request)))
@@ -0,0 +1,126 @@
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.response import Response
+
+from foodgram.models import Tag
+
+CACHE_NAMESPACES = ('tags', 'ingredients', 'auth', 'recipes')
+CACHE_COUNTERS = ('hits', 'misses')
+# Пространства имён, в ответы которых входят данные ключа
+DEPENDENT_NAMESPACES = {
+    'tags': ('recipes',),
+    'ingredients': ('recipes',),
+}
+# Бэкенды кэша, не видные другим воркерам: удаление записи из такого
+# кэша не доходит до остальных процессов
+PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+# Кэши, которые сбрасываются при записи, и что сломается, если другие
+# воркеры не увидят сброс
+SHARED_CACHE_SETTINGS = {
+    'AUTH_TOKEN_CACHE_TIMEOUT':
+        'отозванные токены продолжат работать в других воркерах',
+    'VIEWER_STATE_TIMEOUT':
+        'другие воркеры будут отдавать устаревшие избранное, корзину '
+        'и подписки',
+}
+
+
+def check_settings():
+    '''Кэши, сбрасываемые при записи, допустимы только с общим бэкендом'''
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_CACHES:
+        return
+    for name, problem in SHARED_CACHE_SETTINGS.items():
+        if getattr(settings, name) > 0:
+            raise ImproperlyConfigured(
+                f'{name} > 0 требует общего бэкенда кэша (CACHE_BACKEND), '
+                f'иначе {problem}')
+
+
+def get_version(namespace):
+    '''Текущая версия ключей пространства имён'''
+    return cache.get_or_set(f'{namespace}:version', uuid4().hex, None)
+
+
+def invalidate(namespace):
+    '''Сбрасывает ответы пространства имён и зависящих от него'''
+    cache.set_many({
+        f'{name}:version': uuid4().hex
+        for name in (namespace, *DEPENDENT_NAMESPACES.get(namespace, ()))
+    }, None)
+
+
+def get_tag_ids():
+    '''Словарь slug -> id тегов, хранится в кэше до изменения тегов'''
+    key = f'tags:{get_version("tags")}:ids'
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids)
+    return tag_ids
+
+
+def count(namespace, counter, delta=1):
+    key = f'{namespace}:{counter}'
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def get_stats():
+    '''Счётчики попаданий/промахов для мониторинга'''
+    return {
+        namespace: {
+            counter: cache.get(f'{namespace}:{counter}', 0)
+            for counter in CACHE_COUNTERS
+        }
+        for namespace in CACHE_NAMESPACES
+    }
+
+
+class CachedResponseMixin:
+    '''Кэширует ответы list/retrieve справочных вьюсетов.
+
+    Ключ строится из версии пространства имён, действия, аргументов URL и
+    строки запроса; версия меняется сигналами при изменении моделей.
+    '''
+
+    cache_namespace = None
+
+    def get_etag_data(self, request):
+        '''Ответ меняется только вместе с версией пространства имён'''
+        return get_version(self.cache_namespace)
+
+    def get_cache_key(self, request):
+        query = sorted(request.query_params.lists())
+        params = md5(
+            f'{self.action}:{sorted(self.kwargs.items())}:{query}'.encode()
+        ).hexdigest()
+        return (f'{self.cache_namespace}:'
+                f'{get_version(self.cache_namespace)}:{params}')
+
+    def cached_response(self, request, get_response):
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            count(self.cache_namespace, 'hits')
+            return Response(data)
+        count(self.cache_namespace, 'misses')
+        response = get_response()
+        cache.set(key, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(
+                request, *args, **kwargs))
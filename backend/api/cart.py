@@ -0,0 +1,115 @@
+from array import array
+from threading import Lock
+
+from api.cache import get_version
+from foodgram.models import AmountIngredient, Ingredient, ShoppingCart
+
+# Единица -> (базовая единица, множитель)
+UNITS = {
+    'г': ('г', 1),
+    'гр': ('г', 1),
+    'грамм': ('г', 1),
+    'кг': ('г', 1000),
+    'мг': ('г', 0.001),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'литр': ('мл', 1000),
+    'шт': ('шт', 1),
+    'штук': ('шт', 1),
+}
+
+
+def normalize_name(name):
+    return ' '.join(name.lower().replace('ё', 'е').split())
+
+
+def get_unit_key(unit):
+    '''Единица для сравнения: без регистра, лишних пробелов и точки'''
+    return normalize_name(unit).rstrip('.')
+
+
+def normalize_unit(unit):
+    '''(базовая единица, множитель); неизвестная единица - как в справочнике'''
+    return UNITS.get(get_unit_key(unit), (unit, 1))
+
+
+class CartCatalog:
+    '''Соответствие ингредиентов продуктам списка покупок.
+
+    Ингредиенты с одинаковым названием (без учёта регистра и ё) и
+    сводимыми единицами становятся одним продуктом. Для каждого id
+    ингредиента хранятся номер продукта и множитель к базовой единице;
+    каталог перестраивается вместе с версией кэша ингредиентов.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        # (версия, слоты, множители, продукты): публикуется одним
+        # присваиванием и читается один раз, чтобы не смешать две сборки
+        self.catalog = (None, array('l'), array('d'), ())
+
+    def refresh(self, force=False):
+        '''Каталог текущей версии; force - пересобрать и при той же версии'''
+        version = get_version('ingredients')
+        catalog = self.catalog
+        if version == catalog[0] and not force:
+            return catalog
+        with self.lock:
+            if self.catalog is not catalog and self.catalog[0] == version:
+                return self.catalog
+            rows = list(Ingredient.objects.order_by('pk').values_list(
+                'pk', 'name', 'measurement_unit'))
+            size = rows[-1][0] + 1 if rows else 0
+            slots = array('l', [-1]) * size
+            factors = array('d', [0]) * size
+            keys = {}
+            products = []
+            for pk, name, unit in rows:
+                unit, factor = normalize_unit(unit)
+                key = (normalize_name(name), get_unit_key(unit))
+                if key not in keys:
+                    keys[key] = len(products)
+                    products.append((name, unit))
+                slots[pk] = keys[key]
+                factors[pk] = factor
+            self.catalog = (version, slots, factors, tuple(products))
+            return self.catalog
+
+    @staticmethod
+    def is_known(slots, ingredient_id):
+        return ingredient_id < len(slots) and slots[ingredient_id] >= 0
+
+    def summarize(self, user):
+        '''Продукты из корзины пользователя с суммой в базовых единицах'''
+        rows = list(AmountIngredient.objects.filter(
+            recipe_id__in=ShoppingCart.objects.filter(
+                user=user).values('recipe_id')
+        ).values_list('ingredient_id', 'amount'))
+        catalog = self.refresh()
+        if not all(self.is_known(catalog[1], ingredient_id)
+                   for ingredient_id, _ in rows):
+            # Ингредиент добавлен, а версия кэша ещё не дошла до процесса
+            catalog = self.refresh(force=True)
+        _, slots, factors, products = catalog
+        totals = array('d', [0]) * len(products)
+        found = bytearray(len(products))
+        for ingredient_id, amount in rows:
+            if not self.is_known(slots, ingredient_id):
+                continue
+            slot = slots[ingredient_id]
+            totals[slot] += amount * factors[ingredient_id]
+            found[slot] = 1
+        summary = []
+        for slot, (name, unit) in enumerate(products):
+            if found[slot]:
+                amount = round(totals[slot], 3)
+                summary.append({
+                    'name': name,
+                    'measurement_unit': unit,
+                    'amount': int(amount) if amount.is_integer() else amount,
+                })
+        summary.sort(key=lambda product: normalize_name(product['name']))
+        return summary
+
+
+cart_catalog = CartCatalog()
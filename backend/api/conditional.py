@@ -0,0 +1,44 @@
+from hashlib import md5
+
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers, quote_etag)
+
+
+class ConditionalResponseMixin:
+    '''Условные GET-запросы для list/retrieve.
+
+    Вьюсет определяет get_etag_data(request) - строку, меняющуюся вместе
+    с ответом, или None. ETag считается из неё без сериализации ответа;
+    при совпадении с If-None-Match сразу возвращается 304.
+    '''
+
+    cache_control = {'no_cache': True}
+
+    def get_etag(self, request):
+        data = self.get_etag_data(request)
+        if data is None:
+            return None
+        return quote_etag(md5(data.encode()).hexdigest())
+
+    def conditional_response(self, request, get_response):
+        etag = self.get_etag(request)
+        response = None
+        if etag is not None:
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = get_response()
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_cache_control(response, **self.cache_control)
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalResponseMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalResponseMixin, self).retrieve(
+                request, *args, **kwargs))
@@ -0,0 +1,57 @@
+import base64
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from rest_framework.exceptions import ValidationError
+
+# Кратно 4, чтобы каждый кусок base64 декодировался независимо
+DECODE_CHUNK_SIZE = 4 * 64 * 1024
+HEADER_SIZE = 4 * 1024
+
+
+class RecipeImageField(Base64ImageField):
+    '''Картинка в base64 с проверкой размера до декодирования.
+
+    Данные декодируются кусками в файл, который остаётся в памяти до
+    FILE_UPLOAD_MAX_MEMORY_SIZE и дальше переносится на диск.
+    '''
+
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт',
+    }
+
+    def to_internal_value(self, base64_data):
+        if not isinstance(base64_data, str) or (
+                base64_data in self.EMPTY_VALUES):
+            return super().to_internal_value(base64_data)
+        content_type = None
+        if ';base64,' in base64_data:
+            header, base64_data = base64_data.split(';base64,')
+            content_type = header.replace('data:', '')
+        size = len(base64_data) * 3 // 4
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+
+        name = str(uuid.uuid4())
+        file = UploadedFile(
+            SpooledTemporaryFile(
+                max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE),
+            name, content_type, size)
+        try:
+            for start in range(0, len(base64_data), DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    base64_data[start:start + DECODE_CHUNK_SIZE]))
+        except (TypeError, binascii.Error, ValueError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        file.size = file.tell()
+        file.seek(0)
+        extension = self.get_file_extension(name, file.read(HEADER_SIZE))
+        if extension not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        file.name = f'{name}.{extension}'
+        file.seek(0)
+        return super(Base64FieldMixin, self).to_internal_value(file)
@@ -1,17 +1,80 @@
+from django import forms
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
 from django_filters import rest_framework as filters
 
-from foodgram.models import Ingredient, Recipe
+from api.autocomplete import get_limit
+from api.cache import get_tag_ids
+from foodgram.models import AmountIngredient, Ingredient, Recipe
+from foodgram.search import SEARCH_CONFIG, search_supported
+
+
+class MultipleValueField(forms.Field):
+    '''Все значения параметра, повторённого в строке запроса'''
+
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        return [item for item in value or () if item]
+
+
+class MultipleValueFilter(filters.Filter):
+    field_class = MultipleValueField
 
 
 class RecipesFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(method='check_if_favourited')
     is_in_shopping_cart = filters.BooleanFilter(method='check_if_in_cart')
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = MultipleValueFilter(method='filter_tags')
+    tags_match = filters.ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')), method='skip')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
 
+    def skip(self, queryset, name, value):
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        '''Поиск по названию, описанию и ингредиентам с ранжированием'''
+        if search_supported(queryset):
+            query = SearchQuery(
+                value, config=SEARCH_CONFIG, search_type='websearch')
+            return queryset.filter(search_vector=query).annotate(
+                rank=SearchRank(F('search_vector'), query)
+            ).order_by('-rank', '-pub_date')
+        return queryset.filter(
+            Q(name__icontains=value)
+            | Q(text__icontains=value)
+            | Q(Exists(AmountIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=value)))
+        ).annotate(rank=Case(
+            When(name__icontains=value, then=Value(2)),
+            When(text__icontains=value, then=Value(1)),
+            default=Value(0),
+        )).order_by('-rank', '-pub_date')
+
+    def filter_tags(self, queryset, name, value):
+        '''Рецепты с любым (или со всеми при tags_match=all) из тегов'''
+        tag_ids = get_tag_ids()
+        slugs = set(value)
+        ids = [tag_ids[slug] for slug in slugs if slug in tag_ids]
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_match') != 'all':
+            if not ids:
+                return queryset.none()
+            return queryset.filter(
+                Exists(recipe_tags.filter(tag_id__in=ids)))
+        if len(ids) != len(slugs):
+            return queryset.none()
+        for tag_id in ids:
+            queryset = queryset.filter(
+                Exists(recipe_tags.filter(tag_id=tag_id)))
+        return queryset
+
     def check_if_favourited(self, queryset, name, value):
         if value:
             return queryset.filter(favorites__user=self.request.user)
@@ -24,10 +87,13 @@ class RecipesFilter(filters.FilterSet):
 
 
 class IngredientsFilter(filters.FilterSet):
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def filter_name(self, queryset, name, value):
+        '''Поиск по началу названия, когда индекс в памяти выключен'''
+        return queryset.filter(
+            name__istartswith=value)[:get_limit(self.request)]
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from api.cache import count, get_version
+from api.viewer import get_viewer
+from foodgram.models import Recipe
+
+# Поля рецепта, достаточные для ключа фрагмента
+KEY_FIELDS = ('id', 'author_id', 'updated_at')
+# Поля пользователя, попадающие во фрагмент рецепта
+AUTHOR_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name'))
+IMAGE_FIELDS = ('image', 'image_thumbnail')
+
+
+class RecipeFragmentCache:
+    '''Общая для всех пользователей часть представления рецептов.
+
+    Фрагмент строится без запроса, поэтому флаги пользователя в нём
+    ложны, а ссылки на изображения относительны; render подставляет
+    флаги текущего пользователя и полные ссылки. Ключ содержит
+    updated_at рецепта и версию пространства имён recipes, которую
+    меняют сигналы тегов и ингредиентов; изменение автора удаляет
+    фрагменты его рецептов. Для нескольких воркеров безопасно только
+    с общим бэкендом кэша.
+    '''
+
+    @property
+    def enabled(self):
+        return settings.RECIPE_FRAGMENT_TIMEOUT > 0
+
+    @staticmethod
+    def get_key(version, recipe_id, updated_at):
+        return f'recipes:{version}:{recipe_id}:{updated_at.timestamp()}'
+
+    def get_many(self, recipes, serializer_class):
+        '''Фрагменты по id рецептов: один мульти-get и пакет промахов'''
+        version = get_version('recipes')
+        keys = {
+            self.get_key(version, recipe.pk, recipe.updated_at): recipe.pk
+            for recipe in recipes}
+        found = cache.get_many(keys)
+        fragments = {keys[key]: fragment for key, fragment in found.items()}
+        missing = {
+            recipe_id: key for key, recipe_id in keys.items()
+            if recipe_id not in fragments}
+        if found:
+            count('recipes', 'hits', len(found))
+        if not missing:
+            return fragments
+        count('recipes', 'misses', len(missing))
+        built = serializer_class(
+            Recipe.objects.with_related().filter(pk__in=missing),
+            many=True, context={'fragments': False}).data
+        built = {fragment['id']: dict(fragment) for fragment in built}
+        cache.set_many(
+            {missing[recipe_id]: fragment
+             for recipe_id, fragment in built.items()},
+            settings.RECIPE_FRAGMENT_TIMEOUT)
+        fragments.update(built)
+        return fragments
+
+    def render(self, recipes, serializer_class, context):
+        '''Представления рецептов для пользователя из контекста'''
+        recipes = list(recipes)
+        fragments = self.get_many(recipes, serializer_class)
+        viewer = get_viewer(context)
+        request = context.get('request')
+        representations = []
+        for recipe in recipes:
+            fragment = fragments.get(recipe.pk)
+            if fragment is None:
+                continue
+            data = dict(fragment)
+            data['author'] = {
+                **fragment['author'],
+                'is_subscribed': viewer.is_subscribed(recipe.author_id)}
+            data['is_favorited'] = viewer.is_favorited(recipe.pk)
+            data['is_in_shopping_cart'] = viewer.is_in_shopping_cart(
+                recipe.pk)
+            if request is not None:
+                for field in IMAGE_FIELDS:
+                    if data[field]:
+                        data[field] = request.build_absolute_uri(data[field])
+            representations.append(data)
+        return representations
+
+    def invalidate_author(self, author_id):
+        '''Удаляет фрагменты рецептов автора после изменения его данных'''
+        if not self.enabled:
+            return
+        version = get_version('recipes')
+        cache.delete_many([
+            self.get_key(version, recipe_id, updated_at)
+            for recipe_id, updated_at in Recipe.objects.filter(
+                author_id=author_id).values_list('id', 'updated_at')])
+
+
+recipe_fragments = RecipeFragmentCache()
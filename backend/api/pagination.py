@@ -1,6 +1,105 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipePagination(CustomPagination):
+    '''Постраничный вывод рецептов.
+
+    По умолчанию работает как CustomPagination. С параметром cursor
+    (пустым для первой страницы) включается пагинация по ключу
+    (pub_date, id): без OFFSET и COUNT, с непрозрачными курсорами.
+    '''
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param))
+        reverse = False
+        queryset = queryset.order_by('-pub_date', '-pk')
+        if position is not None:
+            reverse, pub_date, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+                ).order_by('pub_date', 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+                )
+        recipes = list(queryset[:page_size + 1])
+        has_more = len(recipes) > page_size
+        recipes = recipes[:page_size]
+        if reverse:
+            recipes.reverse()
+        self.next_cursor = self.previous_cursor = None
+        if recipes:
+            first, last = recipes[0], recipes[-1]
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(False, last)
+            if position is not None and (has_more or not reverse):
+                self.previous_cursor = self.encode_cursor(True, first)
+        return recipes
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            reverse, pub_date, pk = urlsafe_b64decode(
+                cursor.encode()).decode().split('|')
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError
+            return reverse == '1', pub_date, int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def encode_cursor(reverse, recipe):
+        return urlsafe_b64encode(
+            f'{int(reverse)}|{recipe.pub_date.isoformat()}|{recipe.pk}'
+            .encode()).decode()
+
+    def get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_cursor_link(self.next_cursor)),
+            ('previous', self.get_cursor_link(self.previous_cursor)),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(RecipePagination):
+    '''Лента подписок всегда листается по курсору'''
+
+    def use_cursor(self, request):
+        return True
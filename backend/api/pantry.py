@@ -0,0 +1,187 @@
+from collections import defaultdict
+from threading import Lock
+
+from django.core.cache import cache
+
+from foodgram.models import AmountIngredient
+
+CHANGES_KEY = 'pantry:changes'
+CHANGE_TIMEOUT = 60 * 60
+# Больше изменений за раз дешевле применить полной перестройкой
+REBUILD_THRESHOLD = 1000
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+def to_bitset(recipe_ids):
+    '''Битовое множество (целое число) из id рецептов'''
+    if not recipe_ids:
+        return 0
+    buffer = bytearray(max(recipe_ids) // 8 + 1)
+    for recipe_id in recipe_ids:
+        buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def mark_changed(recipe_id):
+    '''Сообщает индексам всех процессов, что состав рецепта изменился'''
+    try:
+        position = cache.incr(CHANGES_KEY)
+    except ValueError:
+        cache.add(CHANGES_KEY, 0, None)
+        position = cache.incr(CHANGES_KEY)
+    cache.set(f'{CHANGES_KEY}:{position}', recipe_id, CHANGE_TIMEOUT)
+
+
+class PantryResult:
+    '''Найденные рецепты, сгруппированные по доле имеющихся ингредиентов.
+
+    Ведёт себя как последовательность id рецептов для Paginator: длина
+    считается по объединению групп, срез разворачивает только нужные
+    группы, внутри группы - от новых рецептов к старым.
+    '''
+
+    def __init__(self, groups, found):
+        self.groups = groups
+        self.found = found
+
+    def __len__(self):
+        return popcount(self.found)
+
+    def __getitem__(self, page):
+        skip, size = page.start or 0, page.stop - (page.start or 0)
+        recipe_ids = []
+        for bits in self.groups:
+            if len(recipe_ids) == size:
+                break
+            if skip:
+                count = popcount(bits)
+                if count <= skip:
+                    skip -= count
+                    continue
+            while bits and len(recipe_ids) < size:
+                recipe_id = bits.bit_length() - 1
+                bits ^= 1 << recipe_id
+                if skip:
+                    skip -= 1
+                else:
+                    recipe_ids.append(recipe_id)
+        return recipe_ids
+
+
+class PantryIndex:
+    '''Обратный индекс: id ингредиента -> битовое множество id рецептов.
+
+    Строится в памяти процесса при первом запросе и дальше обновляется
+    по журналу изменений в кэше только для изменившихся рецептов.
+    Отдельно хранятся множества рецептов с одинаковым числом ингредиентов.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.position = None
+        self.postings = {}
+        self.sizes = {}
+        self.recipes = {}
+
+    def rebuild(self):
+        postings = defaultdict(list)
+        recipes = defaultdict(list)
+        rows = AmountIngredient.objects.values_list(
+            'ingredient_id', 'recipe_id').iterator()
+        for ingredient_id, recipe_id in rows:
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        sizes = defaultdict(list)
+        for recipe_id, ingredients in recipes.items():
+            sizes[len(ingredients)].append(recipe_id)
+        self.postings = {
+            ingredient_id: to_bitset(recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()}
+        self.sizes = {
+            size: to_bitset(recipe_ids)
+            for size, recipe_ids in sizes.items()}
+        self.recipes = {
+            recipe_id: tuple(ingredients)
+            for recipe_id, ingredients in recipes.items()}
+
+    def apply(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            bit = 1 << recipe_id
+            ingredients = self.recipes.pop(recipe_id, ())
+            for ingredient_id in ingredients:
+                self.postings[ingredient_id] &= ~bit
+            if ingredients:
+                self.sizes[len(ingredients)] &= ~bit
+        recipes = defaultdict(list)
+        for recipe_id, ingredient_id in AmountIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            recipes[recipe_id].append(ingredient_id)
+        for recipe_id, ingredients in recipes.items():
+            bit = 1 << recipe_id
+            for ingredient_id in ingredients:
+                self.postings[ingredient_id] = (
+                    self.postings.get(ingredient_id, 0) | bit)
+            self.sizes[len(ingredients)] = (
+                self.sizes.get(len(ingredients), 0) | bit)
+            self.recipes[recipe_id] = tuple(ingredients)
+
+    def sync(self):
+        current = cache.get(CHANGES_KEY, 0)
+        if self.position == current:
+            return
+        keys = []
+        if self.position is not None and self.position < current:
+            keys = [
+                f'{CHANGES_KEY}:{position}'
+                for position in range(self.position + 1, current + 1)]
+        changes = cache.get_many(keys) if keys else {}
+        if not keys or len(keys) > REBUILD_THRESHOLD or (
+                len(changes) < len(keys)):
+            self.rebuild()
+        else:
+            self.apply(set(changes.values()))
+        self.position = current
+
+    def count_matches(self, ingredient_ids):
+        '''Число найденных ингредиентов сразу для всех рецептов.
+
+        Считается сумматором по битовым срезам: planes[i] - рецепты,
+        у которых i-й бит числа найденных ингредиентов равен 1.
+        '''
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            carry = self.postings.get(ingredient_id, 0)
+            for index, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[index], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        return planes
+
+    def search(self, ingredient_ids):
+        '''Рецепты по убыванию доли имеющихся ингредиентов'''
+        with self.lock:
+            self.sync()
+            planes = self.count_matches(ingredient_ids)
+            sizes = sorted(self.sizes.items())
+        found = 0
+        for plane in planes:
+            found |= plane
+        groups = []
+        for matched in range(1, 2 ** len(planes)):
+            bits = found
+            for index, plane in enumerate(planes):
+                bits &= plane if matched >> index & 1 else ~plane
+            for size, recipes in sizes:
+                if size >= matched and bits & recipes:
+                    groups.append((matched / size, matched, bits & recipes))
+        groups.sort(key=lambda group: group[:2], reverse=True)
+        return PantryResult([bits for _, _, bits in groups], found)
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,37 @@
+from django.db import connections, router
+
+
+def add_relation(model, target_field, target_id, exclude_id=None, **values):
+    '''Добавляет связь одним INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+
+    Строка вставляется, только если объект target_field с id target_id
+    существует и его id не равен exclude_id. Повтор, отсутствующий
+    объект и исключённый id не вызывают IntegrityError. Возвращает True,
+    если строка добавлена.
+    '''
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    target = model._meta.get_field(target_field)
+    target_meta = target.remote_field.model._meta
+    instance = model(**values)
+    columns, params = [], []
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field is target:
+            continue
+        columns.append(quote(field.column))
+        params.append(field.get_db_prep_save(
+            field.pre_save(instance, True), connection))
+    target_pk = quote(target_meta.pk.column)
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(columns)}, {quote(target.column)}) '
+        f'SELECT {", ".join(["%s"] * len(params))}, {target_pk} '
+        f'FROM {quote(target_meta.db_table)} WHERE {target_pk} = %s')
+    params.append(target_id)
+    if exclude_id is not None:
+        sql += f' AND {target_pk} <> %s'
+        params.append(exclude_id)
+    sql += f' ON CONFLICT DO NOTHING RETURNING {quote(model._meta.pk.column)}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone() is not None
@@ -0,0 +1,96 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Echo:
+    '''Псевдобуфер для csv.writer: возвращает строку вместо записи'''
+
+    def write(self, value):
+        return value
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''JSONRenderer на orjson, если он установлен.
+
+    Без orjson и для форматированного вывода (indent) работает как
+    обычный JSONRenderer. Неподдерживаемые orjson типы, в том числе
+    datetime, кодируются энкодером DRF, чтобы ответ не отличался.
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(
+                accepted_media_type, renderer_context or {}) is not None:
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        return orjson.dumps(
+            data, default=self.encoder_class().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        ).replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ShoppingListRenderer(BaseRenderer):
+    '''Базовый рендерер списка покупок.
+
+    Список отдаётся потоком: stream() получает итератор строк запроса
+    с полями name, measurement_unit, amount и выдаёт куски файла.
+    '''
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return str(data.get('detail', data))
+        return ''.join(self.stream(data))
+
+    def stream(self, products):
+        raise NotImplementedError
+
+
+class ShoppingListTxtRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, products):
+        yield 'Нужно купить:'
+        for product in products:
+            yield '\n{name} {amount} {measurement_unit}'.format(**product)
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, products):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'amount', 'measurement_unit'))
+        for product in products:
+            yield writer.writerow((
+                product['name'],
+                product['amount'],
+                product['measurement_unit']))
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return json.dumps(data, ensure_ascii=False)
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def stream(self, products):
+        separator = ''
+        yield '['
+        for product in products:
+            yield separator + json.dumps(product, ensure_ascii=False)
+            separator = ','
+        yield ']'
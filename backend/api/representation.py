@@ -0,0 +1,83 @@
+from collections.abc import Mapping
+from operator import attrgetter, itemgetter
+
+from rest_framework.fields import (BooleanField, CharField, IntegerField,
+                                   ReadOnlyField, SerializerMethodField,
+                                   SkipField)
+from rest_framework.relations import PKOnlyObject
+
+# Поля, чьё to_representation возвращает значение поля модели как есть
+PLAIN_FIELDS = (BooleanField, CharField, IntegerField, ReadOnlyField)
+
+SKIP = object()
+
+
+class CompiledRepresentationMixin:
+    '''to_representation по заранее собранным функциям полей.
+
+    Функции строятся один раз на экземпляр сериалайзера, для many=True -
+    один раз на весь список. Простые поля модели читаются attrgetter
+    (строки .values() - itemgetter) без get_attribute/to_representation,
+    методы SerializerMethodField вызываются напрямую, остальные поля
+    проходят обычный путь DRF.
+    '''
+
+    compiled = True
+
+    def get_model_fields(self):
+        meta = getattr(self, 'Meta', None)
+        if getattr(meta, 'model', None) is None:
+            return frozenset()
+        return frozenset(
+            name for field in meta.model._meta.concrete_fields
+            for name in (field.name, field.attname))
+
+    def compile_field(self, field, mapping):
+        if isinstance(field, SerializerMethodField):
+            return getattr(self, field.method_name)
+        if (isinstance(field, PLAIN_FIELDS)
+                and field.source in self.get_model_fields()):
+            return (itemgetter if mapping else attrgetter)(field.source)
+
+        def mapper(instance):
+            try:
+                attribute = field.get_attribute(instance)
+            except SkipField:
+                return SKIP
+            if isinstance(attribute, PKOnlyObject):
+                if attribute.pk is None:
+                    return None
+            elif attribute is None:
+                return None
+            return field.to_representation(attribute)
+
+        return mapper
+
+    def get_mappers(self, instance):
+        mapping = isinstance(instance, Mapping)
+        mappers = self.__dict__.setdefault('_compiled_mappers', {})
+        if mapping not in mappers:
+            mappers[mapping] = [
+                (field.field_name, self.compile_field(field, mapping))
+                for field in self._readable_fields]
+        return mappers[mapping]
+
+    def to_representation(self, instance):
+        if not self.compiled:
+            return super().to_representation(instance)
+        representation = {}
+        for name, mapper in self.get_mappers(instance):
+            value = mapper(instance)
+            if value is not SKIP:
+                representation[name] = value
+        return representation
+
+
+class ValuesListMixin:
+    '''list отдаёт строки .values() по полям сериалайзера вместо моделей'''
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            return queryset.values(*self.get_serializer_class().Meta.fields)
+        return queryset
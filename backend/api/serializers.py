@@ -1,5 +1,6 @@
 from django.core.validators import MinValueValidator, ValidationError
-from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import F
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
@@ -7,9 +8,14 @@ from rest_framework.fields import SerializerMethodField
 from rest_framework.serializers import (IntegerField, ModelSerializer,
                                         PrimaryKeyRelatedField, ReadOnlyField)
 
-from foodgram.models import (Favorite, Ingredient, Recipe, AmountIngredient,
-                             ShoppingCart, Tag)
-from users.models import User, Subscription
+from api.fields import RecipeImageField
+from api.fragments import recipe_fragments
+from api.pantry import mark_changed
+from api.representation import CompiledRepresentationMixin
+from foodgram.models import Ingredient, Recipe, AmountIngredient, Tag
+from foodgram.thumbnails import schedule_thumbnail
+from api.viewer import get_viewer
+from users.models import User
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -20,7 +26,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         fields = ('email', 'username', 'first_name', 'last_name', 'password',)
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(CompiledRepresentationMixin, UserSerializer):
     '''Сериалайзер пользователя'''
 
     is_subscribed = SerializerMethodField()
@@ -33,15 +39,28 @@ class CustomUserSerializer(UserSerializer):
             'is_subscribed',)
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_viewer(self.context).is_subscribed(obj.pk)
+
+
+class ThumbnailMixin(serializers.Serializer):
+    '''Ссылка на миниатюру, пока её нет - на оригинал'''
+
+    image_thumbnail = SerializerMethodField()
+
+    def get_image_thumbnail(self, obj):
+        image = obj.image_thumbnail or obj.image
+        if not image:
+            return None
         request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj
-        ).exists()
+        if request is None:
+            return image.url
+        return request.build_absolute_uri(image.url)
 
 
-class RecipeAbbSerializer(serializers.ModelSerializer):
+class RecipeAbbSerializer(CompiledRepresentationMixin, ThumbnailMixin,
+                          serializers.ModelSerializer):
     '''Сериалайзер быстого просмотра рецепта'''
 
     class Meta:
@@ -50,6 +69,7 @@ class RecipeAbbSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_thumbnail',
             'cooking_time'
         )
         read_only = '__all__',
@@ -72,29 +92,35 @@ class FollowSerializer(CustomUserSerializer):
         )
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
+    @staticmethod
+    def get_recipes_limit(request):
+        '''Значение recipes_limit из запроса или None'''
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            return IntegerField(min_value=0).run_validation(recipes_limit)
+        except serializers.ValidationError as error:
+            raise serializers.ValidationError(
+                {'recipes_limit': error.detail})
+
     def get_recipes(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes_limit = request.GET.get('recipes_limit')
+        recipes_limit = self.get_recipes_limit(request)
         recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = (obj.recipes.all())[:int(recipes_limit)]
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
         return RecipeAbbSerializer(recipes, many=True).data
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj
-        ).exists()
-
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_total'):
+            return obj.recipes_total
         return obj.recipes.count()
 
 
-class MyTagSerializer(ModelSerializer):
+class MyTagSerializer(CompiledRepresentationMixin, ModelSerializer):
     '''Сериалайзер тегов'''
 
     class Meta:
@@ -102,7 +128,7 @@ class MyTagSerializer(ModelSerializer):
         fields = ('id', 'name', 'color', 'slug',)
 
 
-class MyIngredientSerializer(ModelSerializer):
+class MyIngredientSerializer(CompiledRepresentationMixin, ModelSerializer):
     '''Сериалайзер ингредиентов'''
 
     class Meta:
@@ -110,7 +136,8 @@ class MyIngredientSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit',)
 
 
-class RecipeIngredientsSerializer(ModelSerializer):
+class RecipeIngredientsSerializer(CompiledRepresentationMixin,
+                                  ModelSerializer):
     '''Сериалайзер отображения рецептов'''
 
     id = ReadOnlyField(
@@ -125,12 +152,24 @@ class RecipeIngredientsSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
-class GetMyRecipeSerializer(ModelSerializer):
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    '''Список рецептов из кэша фрагментов одним пакетом'''
+
+    def to_representation(self, data):
+        if not recipe_fragments.enabled or not self.context.get(
+                'fragments', True):
+            return super().to_representation(data)
+        return recipe_fragments.render(data, type(self.child), self.context)
+
+
+class GetMyRecipeSerializer(CompiledRepresentationMixin, ThumbnailMixin,
+                            ModelSerializer):
     '''Сериалайзер чтения рецептов'''
 
     tags = MyTagSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
-    ingredients = SerializerMethodField('get_ingredients_for_recipe')
+    ingredients = RecipeIngredientsSerializer(
+        source='in_recipes', many=True, read_only=True)
     is_favorited = SerializerMethodField('check_if_favourited')
     is_in_shopping_cart = SerializerMethodField('check_if_in_cart')
     image = Base64ImageField()
@@ -139,24 +178,23 @@ class GetMyRecipeSerializer(ModelSerializer):
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time',)
-
-    def get_ingredients_for_recipe(self, obj):
-        ingredients = AmountIngredient.objects.filter(recipe=obj)
+                  'name', 'image', 'image_thumbnail', 'text',
+                  'cooking_time',)
+        list_serializer_class = RecipeFragmentListSerializer
 
-        return RecipeIngredientsSerializer(ingredients, many=True).data
+    def to_representation(self, instance):
+        if recipe_fragments.enabled and self.context.get('fragments', True):
+            representations = recipe_fragments.render(
+                (instance,), type(self), self.context)
+            if representations:
+                return representations[0]
+        return super().to_representation(instance)
 
     def check_if_favourited(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return obj.favorites.filter(recipe=obj).exists()
+        return get_viewer(self.context).is_favorited(obj.pk)
 
     def check_if_in_cart(self, obj):
-        request = self.context.get('request')
-        if not request or request.user.is_anonymous:
-            return False
-        return request.user.shopping_cart.filter(recipe=obj).exists()
+        return get_viewer(self.context).is_in_shopping_cart(obj.pk)
 
 
 class AddIngredientsToRecipe(ModelSerializer):
@@ -175,7 +213,7 @@ class PostMyRecipeSerializer(ModelSerializer):
 
     ingredients = AddIngredientsToRecipe(many=True)
     tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
     cooking_time = IntegerField(validators=(
         MinValueValidator(
             1,
@@ -201,6 +239,11 @@ class PostMyRecipeSerializer(ModelSerializer):
                     raise ValidationError(
                         {'ingredients_amount': 'Нет ингредиентов!'}
                     )
+            if len(Ingredient.objects.in_bulk(ingredient_ids)) != len(
+                    ingredient_ids):
+                raise ValidationError(
+                    {'ingredients_existence': 'Ингредиент не найден'}
+                )
         else:
             raise ValidationError({
                 'ingredients_existence': 'Ингредиенты отсутствуют'})
@@ -222,76 +265,75 @@ class PostMyRecipeSerializer(ModelSerializer):
 
     @staticmethod
     def get_ingredients(recipe=None, ingredients=None):
-        for ingredient in ingredients:
-            AmountIngredient.objects.bulk_create(
-                [AmountIngredient(
-                    recipe=recipe,
-                    ingredient=Ingredient.objects.get(id=ingredient['id']),
-                    amount=ingredient['amount']
-                )])
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount'])
+            for ingredient in ingredients)
+
+    @staticmethod
+    def update_ingredients(recipe=None, ingredients=None):
+        '''Пишет только изменившиеся строки AmountIngredient'''
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients}
+        changed, removed = [], []
+        for amount_ingredient in recipe.in_recipes.all():
+            amount = amounts.pop(amount_ingredient.ingredient_id, None)
+            if amount is None:
+                removed.append(amount_ingredient.pk)
+            elif amount_ingredient.amount != amount:
+                amount_ingredient.amount = amount
+                changed.append(amount_ingredient)
+        if removed:
+            AmountIngredient.objects.filter(pk__in=removed).delete()
+        AmountIngredient.objects.bulk_update(changed, ('amount',))
+        PostMyRecipeSerializer.get_ingredients(recipe, [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in amounts.items()])
+
+    @staticmethod
+    def after_commit(recipe_id, image_changed):
+        '''Фоновые обновления рецепта после фиксации транзакции'''
+        def callback():
+            if image_changed:
+                schedule_thumbnail(recipe_id)
+            mark_changed(recipe_id)
 
+        transaction.on_commit(callback)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(
             author=self.context.get('request').user,
             **validated_data)
+        User.objects.filter(pk=recipe.author_id).update(
+            recipes_count=F('recipes_count') + 1)
         self.get_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        self.after_commit(recipe.pk, image_changed=True)
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        self.get_ingredients(instance, ingredients)
-        instance.tags.set(tags)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        if tags is not None:
+            instance.tags.set(tags)
+        if 'image' in validated_data:
+            validated_data['image_thumbnail'] = ''
+        self.after_commit(
+            instance.pk, image_changed='image' in validated_data)
 
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        if not recipe_fragments.enabled:
+            instance = Recipe.objects.with_related().get(pk=instance.pk)
         return GetMyRecipeSerializer(instance, context=self.context).data
-
-
-class FavouriteSerializer(ModelSerializer):
-    '''Сериалайзер добавления в избранное'''
-
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
-
-    def validate(self, data):
-        if Favorite.objects.filter(
-            user=data.get('user'),
-            recipe=data.get('recipe')
-        ).exists():
-            raise IntegrityError('Рецепт уже добавлен в Избранное')
-        return data
-
-    def to_representation(self, instance):
-        return GetMyRecipeSerializer(
-            instance.recipe,
-            context=self.context).data
-
-
-class ShoppingCartSerializer(ModelSerializer):
-    '''Сериалайзер добавления в корзину'''
-
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe')
-
-    def validate(self, data):
-        if ShoppingCart.objects.filter(
-            user=data.get('user'),
-            recipe=data.get('recipe')
-        ).exists():
-            raise IntegrityError('Рецепт уже в корзине')
-        return data
-
-    def to_representation(self, instance):
-        return GetMyRecipeSerializer(
-            instance.recipe,
-            context=self.context).data
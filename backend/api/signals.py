@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.cache import invalidate
+from api.fragments import AUTHOR_FIELDS, recipe_fragments
+from api.pantry import mark_changed
+from foodgram.models import AmountIngredient, Ingredient, Recipe, Tag
+from foodgram.search import update_search_vector
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    invalidate('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    invalidate('ingredients')
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def update_ingredient_search(instance, created=False, **kwargs):
+    '''Название ингредиента входит в поисковый вектор его рецептов'''
+    if created:
+        return
+    recipe_ids = list(AmountIngredient.objects.filter(
+        ingredient=instance).values_list('recipe_id', flat=True))
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search_vector(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(instance, **kwargs):
+    '''После изменения рецепта через API или админку'''
+    transaction.on_commit(lambda: update_search_vector((instance.pk,)))
+
+
+@receiver((post_save, post_delete), sender=AmountIngredient)
+def update_pantry_index(instance, **kwargs):
+    transaction.on_commit(lambda: mark_changed(instance.recipe_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, **kwargs):
+    '''Смена пароля, блокировка и другие изменения пользователя'''
+    if settings.AUTH_TOKEN_CACHE_TIMEOUT > 0:
+        for key in Token.objects.filter(
+                user=instance).values_list('key', flat=True):
+            token_cache.invalidate(key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, update_fields=None, **kwargs):
+    '''Имя и почта автора хранятся во фрагментах его рецептов'''
+    if update_fields is not None and AUTHOR_FIELDS.isdisjoint(update_fields):
+        return
+    transaction.on_commit(
+        lambda: recipe_fragments.invalidate_author(instance.pk))
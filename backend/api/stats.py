@@ -0,0 +1,238 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import ListSerializer, Serializer
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS_KEY = 'stats:endpoints'
+# Верхние границы корзин гистограмм
+METRICS = {
+    'queries': (1, 2, 5, 10, 20, 50, 100),
+    'db_ms': (1, 5, 10, 25, 50, 100, 250, 500),
+    'serializer_ms': (1, 5, 10, 25, 50, 100, 250, 500),
+    'wall_ms': (5, 10, 25, 50, 100, 250, 500, 1000),
+}
+
+current = ContextVar('request_stats', default=None)
+
+
+def get_bucket(metric, value):
+    for bound in METRICS[metric]:
+        if value <= bound:
+            return f'le_{bound}'
+    return 'inf'
+
+
+class RequestStats:
+    '''Запросы к БД и время одного HTTP-запроса.
+
+    Экземпляр служит обёрткой execute_wrapper для всех подключений,
+    поэтому видит каждый SQL-запрос с его текстом без параметров.
+    '''
+
+    def __init__(self):
+        self.endpoint = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.depth = 0
+        self.sql = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.sql[sql] += 1
+
+    def get_repeated(self):
+        '''Самый частый SQL, если он повторился подозрительно много раз'''
+        if not self.sql:
+            return None
+        sql, repeats = self.sql.most_common(1)[0]
+        if repeats < settings.REQUEST_STATS_REPEATS:
+            return None
+        return sql, repeats
+
+
+def timed(data):
+    '''Считает время внешнего вызова serializer.data в текущем запросе'''
+
+    def wrapper(self):
+        stats = current.get()
+        if stats is None or stats.depth:
+            return data.fget(self)
+        stats.depth += 1
+        start = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            stats.serializer_time += time.perf_counter() - start
+            stats.depth -= 1
+
+    wrapper.timed = True
+    return property(wrapper)
+
+
+def patch_serializers():
+    for serializer in (Serializer, ListSerializer):
+        if not getattr(serializer.data.fget, 'timed', False):
+            serializer.data = timed(serializer.data)
+
+
+class StatsCollector:
+    '''Копит метрики в памяти процесса и сбрасывает их в кэш пачками.
+
+    В кэше хранятся суммы и корзины гистограмм по каждому эндпоинту,
+    поэтому отчёт собирает данные всех воркеров с общим бэкендом кэша.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending = Counter()
+        self.repeated = {}
+        self.flushed = time.monotonic()
+
+    def add(self, endpoint, values, repeated):
+        with self.lock:
+            self.pending[(endpoint, 'requests')] += 1
+            for metric, value in values.items():
+                bucket = get_bucket(metric, value)
+                self.pending[(endpoint, metric, 'sum')] += value
+                self.pending[(endpoint, metric, bucket)] += 1
+            if repeated:
+                self.pending[(endpoint, 'n_plus_one')] += 1
+                self.repeated[endpoint] = repeated
+        if time.monotonic() - self.flushed >= settings.REQUEST_STATS_FLUSH:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            repeated, self.repeated = self.repeated, {}
+            self.flushed = time.monotonic()
+        if not pending:
+            return
+        endpoints = cache.get(ENDPOINTS_KEY, set())
+        new = {key[0] for key in pending} - endpoints
+        if new:
+            cache.set(ENDPOINTS_KEY, endpoints | new, None)
+        for key, delta in pending.items():
+            key = ':'.join(('stats',) + key)
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                if not cache.add(key, delta, None):
+                    cache.incr(key, delta)
+        for endpoint, (sql, repeats) in repeated.items():
+            cache.set(f'stats:{endpoint}:repeated_sql',
+                      {'sql': sql, 'repeats': repeats}, None)
+
+    def get_report(self):
+        '''Средние значения и гистограммы по эндпоинтам'''
+        self.flush()
+        endpoints = sorted(cache.get(ENDPOINTS_KEY, set()))
+        keys = []
+        for endpoint in endpoints:
+            keys += [f'stats:{endpoint}:requests',
+                     f'stats:{endpoint}:n_plus_one',
+                     f'stats:{endpoint}:repeated_sql']
+            for metric, bounds in METRICS.items():
+                keys += [f'stats:{endpoint}:{metric}:{bucket}' for bucket in (
+                    ['sum', 'inf'] + [f'le_{bound}' for bound in bounds])]
+        values = cache.get_many(keys)
+        report = {}
+        for endpoint in endpoints:
+            prefix = f'stats:{endpoint}'
+            requests = values.get(f'{prefix}:requests', 0)
+            report[endpoint] = {
+                'requests': requests,
+                'n_plus_one': values.get(f'{prefix}:n_plus_one', 0),
+                'repeated_sql': values.get(f'{prefix}:repeated_sql'),
+            }
+            for metric, bounds in METRICS.items():
+                buckets = [f'le_{bound}' for bound in bounds] + ['inf']
+                report[endpoint][metric] = {
+                    'avg': round(values.get(
+                        f'{prefix}:{metric}:sum', 0) / (requests or 1), 1),
+                    'histogram': {
+                        bucket: values.get(f'{prefix}:{metric}:{bucket}', 0)
+                        for bucket in buckets},
+                }
+        return report
+
+
+collector = StatsCollector()
+
+
+class RequestStatsMiddleware:
+    '''Метрики запросов по эндпоинтам DRF: число и время запросов к БД,
+    время сериализации и общее время, повторяющийся SQL (N+1).
+
+    Включается настройкой REQUEST_STATS; когда она выключена, Django
+    не подключает middleware вовсе.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        patch_serializers()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current.get()
+        if stats is None:
+            return
+        view = getattr(view_func, 'cls', view_func)
+        action = (getattr(view_func, 'actions', None) or {}).get(
+            request.method.lower(), request.method.lower())
+        stats.endpoint = f'{view.__name__}.{action}'
+
+    @staticmethod
+    def record(request, response, stats, wall_time):
+        if stats.endpoint is None:
+            return
+        values = {
+            'queries': stats.queries,
+            'db_ms': round(stats.db_time * 1000),
+            'serializer_ms': round(stats.serializer_time * 1000),
+            'wall_ms': round(wall_time * 1000),
+        }
+        repeated = stats.get_repeated()
+        collector.add(stats.endpoint, values, repeated)
+        if settings.REQUEST_STATS_LOG:
+            logger.info(json.dumps({
+                'endpoint': stats.endpoint,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'repeated_sql': repeated and repeated[0],
+                'repeats': repeated and repeated[1],
+                **values,
+            }, ensure_ascii=False))
@@ -0,0 +1,728 @@
+from base64 import urlsafe_b64encode
+from collections import defaultdict
+from io import StringIO
+from tempfile import NamedTemporaryFile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, router
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import token_cache
+from api.cache import SHARED_CACHE_SETTINGS, check_settings
+from api.pagination import RecipePagination
+from api.pantry import PantryIndex, mark_changed
+from api.serializers import GetMyRecipeSerializer
+from api.viewer import LOADERS, ViewerState
+from config.routers import ReplicaMiddleware, ReplicaSet
+from foodgram.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                             ShoppingCart, Tag)
+from users.models import Subscription, User
+
+
+class RecipeTestCase(TestCase):
+    '''Авторизованный по токену клиент, теги, ингредиенты и авторы'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='viewer', email='viewer@example.com', password='pass')
+        cls.token = Token.objects.create(user=cls.user)
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com', password='pass')
+            for number in range(3)]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(3)]
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(10))
+        cls.ingredients = list(Ingredient.objects.all())
+        Subscription.objects.create(user=cls.user, author=cls.authors[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    @classmethod
+    def create_recipes(cls, count, tags=None):
+        '''Рецепты с тегами и ингредиентами, часть - в избранном и корзине'''
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % len(cls.authors)],
+                name=f'Рецепт {number}', text='Описание', cooking_time=5,
+                image='recipes_image/test.png')
+            recipe.tags.set(tags or cls.tags[:2])
+            AmountIngredient.objects.bulk_create(
+                AmountIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1)
+                for ingredient in cls.ingredients[:3])
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3 == 0:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            recipes.append(recipe)
+        return recipes
+
+
+class RecipeListQueriesTest(RecipeTestCase):
+    '''Число запросов списка рецептов не зависит от размера страницы'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.create_recipes(200)
+
+    def test_query_count_is_constant(self):
+        # Токен, COUNT, страница с авторами, теги, ингредиенты,
+        # избранное, корзина и подписки пользователя
+        for limit in (6, 50, 200):
+            with self.subTest(limit=limit), self.assertNumQueries(8):
+                response = self.client.get(
+                    '/api/recipes/', {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+
+class RecipeConditionalTest(RecipeTestCase):
+    '''ETag рецепта и ответ 304 без сериализации'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = cls.create_recipes(1)[0]
+
+    def get_etag(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_not_modified_skips_serializer(self):
+        etag = self.get_etag()
+        serialize = patch.object(
+            GetMyRecipeSerializer, 'to_representation',
+            side_effect=AssertionError('Сериализация при 304'))
+        with serialize as to_representation, self.assertNumQueries(2):
+            response = self.client.get(
+                f'/api/recipes/{self.recipe.pk}/', HTTP_IF_NONE_MATCH=etag)
+        to_representation.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+
+    def test_author_change_updates_etag(self):
+        etag = self.get_etag()
+        author = self.recipe.author
+        author.first_name = 'Новое имя'
+        author.save()
+        response = self.client.get(
+            f'/api/recipes/{self.recipe.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['author']['first_name'], 'Новое имя')
+
+
+class RecipeCursorPaginationTest(RecipeTestCase):
+    '''Пагинация рецептов по курсору (pub_date, id)'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        recipes = cls.create_recipes(11)
+        # Часть рецептов с одной датой: порядок внутри решает id
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes[2:7]]
+        ).update(pub_date=recipes[2].pub_date)
+        cls.expected = list(Recipe.objects.order_by(
+            '-pub_date', '-pk').values_list('id', flat=True))
+
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        return response.data
+
+    def test_cursor_round_trip(self):
+        recipe = Recipe.objects.get(pk=self.expected[0])
+        for reverse in (False, True):
+            with self.subTest(reverse=reverse):
+                cursor = RecipePagination.encode_cursor(reverse, recipe)
+                self.assertEqual(
+                    RecipePagination().decode_cursor(cursor),
+                    (reverse, recipe.pub_date, recipe.pk))
+
+    def test_forward_and_backward(self):
+        pages = []
+        data = self.get_page('/api/recipes/', {'cursor': '', 'limit': 3})
+        self.assertIsNone(data['previous'])
+        while True:
+            pages.append([recipe['id'] for recipe in data['results']])
+            if data['next'] is None:
+                break
+            data = self.get_page(data['next'])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual(len(pages[-1]), len(self.expected) % 3)
+        for page in reversed(pages[:-1]):
+            data = self.get_page(data['previous'])
+            self.assertEqual(
+                [recipe['id'] for recipe in data['results']], page)
+        self.assertIsNone(data['previous'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('abc', urlsafe_b64encode(b'0|now|1').decode(),
+                       urlsafe_b64encode(b'0|2023-01-01T00:00:00').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class FeedTest(RecipeTestCase):
+    '''Лента рецептов авторов из подписок'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.create_recipes(9)
+
+    def get_feed(self):
+        response = self.client.get('/api/recipes/feed/', {'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def get_expected(self, authors):
+        return list(Recipe.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-pk').values_list('id', flat=True))
+
+    def test_only_followed_authors(self):
+        self.assertEqual(self.get_feed(), self.get_expected(self.authors[:1]))
+        Subscription.objects.create(user=self.user, author=self.authors[1])
+        self.assertEqual(self.get_feed(), self.get_expected(self.authors[:2]))
+
+    def test_anonymous(self):
+        self.client.credentials()
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+
+class SubscriptionsTest(RecipeTestCase):
+    '''Список подписок'''
+
+    def test_recipes_count_ignores_counter_column(self):
+        self.create_recipes(6)
+        author = self.authors[0]
+        self.assertEqual(User.objects.get(pk=author.pk).recipes_count, 0)
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 1})
+        self.assertEqual(response.status_code, 200)
+        [subscription] = response.data['results']
+        self.assertEqual(subscription['recipes_count'], 2)
+        self.assertEqual(len(subscription['recipes']), 1)
+
+    def test_invalid_recipes_limit(self):
+        for recipes_limit in ('abc', '-1'):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.client.get(
+                    '/api/users/subscriptions/',
+                    {'recipes_limit': recipes_limit})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), ['recipes_limit'])
+
+
+class IngredientSearchTest(RecipeTestCase):
+    '''Подсказки ингредиентов по индексу в памяти и по БД'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='ликер Baileys', measurement_unit='мл')]
+            + [Ingredient(name=f'соль {number:02}', measurement_unit='г')
+               for number in range(30)])
+
+    def search(self, **params):
+        response = self.client.get('/api/ingredients/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_results_are_limited(self):
+        for index in (True, False):
+            with self.subTest(index=index), self.settings(
+                    INGREDIENT_INDEX=index):
+                cache.clear()
+                self.assertEqual(len(self.search(name='соль')), 20)
+                self.assertEqual(
+                    len(self.search(name='соль', limit=25)), 25)
+
+    def test_search_is_case_insensitive(self):
+        for index in (True, False):
+            with self.subTest(index=index), self.settings(
+                    INGREDIENT_INDEX=index):
+                cache.clear()
+                self.assertEqual(self.search(name='ликер B'), [{
+                    'id': Ingredient.objects.get(name='ликер Baileys').pk,
+                    'name': 'ликер Baileys', 'measurement_unit': 'мл'}])
+
+    def test_index_does_not_query_ingredients(self):
+        self.search(name='соль')
+        # Только токен: индекс уже построен для текущей версии
+        with self.assertNumQueries(1):
+            data = self.search(name='со', limit=3)
+        self.assertEqual(
+            [ingredient['name'] for ingredient in data],
+            ['соль 00', 'соль 01', 'соль 02'])
+
+
+class SearchVectorSignalsTest(RecipeTestCase):
+    '''Поисковые векторы обновляются при изменениях вне API'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = cls.create_recipes(1)[0]
+
+    def test_recipe_save_updates_vector(self):
+        updating = patch('api.signals.update_search_vector')
+        with updating as update, self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Борщ'
+            self.recipe.save()
+        update.assert_called_once_with((self.recipe.pk,))
+
+    def test_ingredient_rename_updates_vectors(self):
+        ingredient = self.ingredients[0]
+        updating = patch('api.signals.update_search_vector')
+        with updating as update, self.captureOnCommitCallbacks(execute=True):
+            ingredient.name = 'свёкла'
+            ingredient.save()
+        update.assert_called_once_with([self.recipe.pk])
+
+
+class TagFilterTest(RecipeTestCase):
+    '''Фильтр рецептов по нескольким тегам'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        first, second, third = cls.tags
+        cls.both = cls.create_recipes(3, tags=[first, second])
+        cls.first = cls.create_recipes(2, tags=[first])
+        cls.third = cls.create_recipes(4, tags=[third])
+
+    def get_ids(self, **params):
+        response = self.client.get(
+            '/api/recipes/', {'limit': 100, **params})
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(len(ids), response.data['count'])
+        return ids
+
+    @staticmethod
+    def get_expected(*groups):
+        return sorted(recipe.pk for group in groups for recipe in group)
+
+    def test_any_tag_without_duplicates(self):
+        ids = self.get_ids(tags=['tag0', 'tag1'])
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), self.get_expected(self.both, self.first))
+        ids = self.get_ids(tags=['tag1', 'tag2'])
+        self.assertEqual(sorted(ids), self.get_expected(self.both, self.third))
+
+    def test_all_tags(self):
+        self.assertEqual(
+            sorted(self.get_ids(tags=['tag0', 'tag1'], tags_match='all')),
+            self.get_expected(self.both))
+        self.assertEqual(
+            self.get_ids(tags=['tag0', 'tag2'], tags_match='all'), [])
+        self.assertEqual(
+            self.get_ids(tags=['tag0', 'missing'], tags_match='all'), [])
+
+    def test_unknown_tags(self):
+        self.assertEqual(self.get_ids(tags=['missing']), [])
+
+
+class ShoppingCartSummaryTest(RecipeTestCase):
+    '''Сводка корзины с единицами, приведёнными к базовым'''
+
+    def test_summary_merges_units_and_sees_new_ingredients(self):
+        recipe = self.create_recipes(1)[0]
+        self.client.get('/api/recipes/shopping_cart/summary/')
+        # Без сигналов: версия кэша ингредиентов не меняется
+        Ingredient.objects.bulk_create((
+            Ingredient(name='Мука', measurement_unit='кг'),
+            Ingredient(name='мука', measurement_unit='г')))
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(recipe=recipe, ingredient=ingredient, amount=2)
+            for ingredient in Ingredient.objects.filter(
+                name__in=('Мука', 'мука')))
+        response = self.client.get('/api/recipes/shopping_cart/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            {'name': 'Мука', 'measurement_unit': 'г', 'amount': 2002},
+            response.data)
+
+    def test_unknown_units_keep_their_spelling(self):
+        recipe = self.create_recipes(1)[0]
+        Ingredient.objects.bulk_create((
+            Ingredient(name='сахар', measurement_unit='ст. л.'),
+            Ingredient(name='Сахар', measurement_unit='Ст. Л')))
+        AmountIngredient.objects.bulk_create(
+            AmountIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in Ingredient.objects.filter(
+                name__in=('сахар', 'Сахар')))
+        response = self.client.get('/api/recipes/shopping_cart/summary/')
+        self.assertIn(
+            {'name': 'сахар', 'measurement_unit': 'ст. л.', 'amount': 2},
+            response.data)
+
+
+class SharedCacheSettingsTest(TestCase):
+    '''Кэши, сбрасываемые при записи, запрещены с кэшем в памяти процесса'''
+
+    def test_process_cache_is_rejected(self):
+        for name in SHARED_CACHE_SETTINGS:
+            with self.subTest(setting=name), self.settings(**{name: 60}):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_settings()
+
+    def test_shared_cache_is_allowed(self):
+        with self.settings(
+                AUTH_TOKEN_CACHE_TIMEOUT=60, VIEWER_STATE_TIMEOUT=60,
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.'
+                               'FileBasedCache',
+                    'LOCATION': '/tmp/foodgram-tests'}}):
+            check_settings()
+
+
+class TokenCacheTest(RecipeTestCase):
+    '''Кэш токенов хранит только часть полей пользователя'''
+
+    def setUp(self):
+        super().setUp()
+        timeout = self.settings(AUTH_TOKEN_CACHE_TIMEOUT=60)
+        timeout.enable()
+        self.addCleanup(timeout.disable)
+
+    def test_snapshot_without_password(self):
+        expected = self.client.get('/api/users/me/').data
+        data = cache.get(token_cache.get_cache_key(self.token.key))
+        self.assertNotIn(self.user.password, data)
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data, expected)
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_profile_save_keeps_counters(self):
+        self.client.get('/api/users/me/')
+        User.objects.filter(pk=self.user.pk).update(
+            followers_count=5, recipes_count=3)
+        response = self.client.patch(
+            '/api/users/me/', {'first_name': 'Имя'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Имя')
+        self.assertEqual((user.followers_count, user.recipes_count), (5, 3))
+        self.assertTrue(user.check_password('pass'))
+
+    def test_full_save_keeps_counters(self):
+        user = User.objects.get(pk=self.user.pk)
+        User.objects.filter(pk=user.pk).update(
+            followers_count=F('followers_count') + 1)
+        user.last_name = 'Фамилия'
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.last_name, 'Фамилия')
+        self.assertEqual(user.followers_count, 1)
+
+
+class ViewerStateCacheTest(RecipeTestCase):
+    '''Кэш избранного, корзины и подписок между запросами'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = cls.create_recipes(2)[1]
+
+    def setUp(self):
+        super().setUp()
+        timeout = self.settings(VIEWER_STATE_TIMEOUT=60)
+        timeout.enable()
+        self.addCleanup(timeout.disable)
+
+    def is_favorited(self):
+        return self.client.get(
+            f'/api/recipes/{self.recipe.pk}/').json()['is_favorited']
+
+    def test_sets_are_cached_together(self):
+        ViewerState(self.user).get_ids('favorites')
+        with self.assertNumQueries(0):
+            viewer = ViewerState(self.user)
+            self.assertTrue(viewer.is_favorited(self.recipe.pk))
+            self.assertTrue(viewer.is_subscribed(self.authors[0].pk))
+            viewer.is_in_shopping_cart(self.recipe.pk)
+
+    def test_stale_load_is_not_served(self):
+        self.assertTrue(self.is_favorited())
+        cache.clear()
+        viewer = ViewerState(self.user)
+        stale = list(LOADERS['favorites'](self.user))
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        with patch.dict(LOADERS, favorites=lambda user: stale):
+            self.assertTrue(viewer.is_favorited(self.recipe.pk))
+        self.assertFalse(self.is_favorited())
+
+
+class RecipeFragmentCacheTest(RecipeTestCase):
+    '''Кэш общей части рецептов не меняет ответы'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = cls.create_recipes(6)
+
+    def get(self, url, timeout):
+        with self.settings(RECIPE_FRAGMENT_TIMEOUT=timeout):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cached_responses_match(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipes[0].pk}/'):
+            with self.subTest(url=url):
+                expected = self.get(url, 0)
+                self.assertEqual(self.get(url, 300), expected)
+                self.assertEqual(self.get(url, 300), expected)
+
+    def test_author_change_invalidates(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.pk}/'
+        self.get(url, 300)
+        author = User.objects.get(pk=recipe.author_id)
+        author.last_name = 'Новая'
+        with self.settings(RECIPE_FRAGMENT_TIMEOUT=300):
+            with self.captureOnCommitCallbacks(execute=True):
+                author.save()
+        self.assertEqual(self.get(url, 300)['author']['last_name'], 'Новая')
+
+    def test_ingredient_upsert_invalidates(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        self.get(url, 300)
+        with NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write(f'{self.ingredients[0].name},кг\n')
+            file.flush()
+            call_command(
+                'load_ingredients', file.name, '--upsert', '--no-copy',
+                stdout=StringIO())
+        units = {
+            ingredient['id']: ingredient['measurement_unit']
+            for ingredient in self.get(url, 300)['ingredients']}
+        self.assertEqual(units[self.ingredients[0].pk], 'кг')
+
+
+class IdempotentWritesTest(RecipeTestCase):
+    '''Избранное, корзина и подписки: повторы не приводят к ошибке 500'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipe = Recipe.objects.create(
+            author=cls.authors[1], name='Рецепт', text='Описание',
+            cooking_time=5, image='recipes_image/test.png')
+
+    def test_favorite_and_cart(self):
+        for action, model in (('favorite', Favorite),
+                              ('shopping_cart', ShoppingCart)):
+            with self.subTest(action=action):
+                url = f'/api/recipes/{self.recipe.pk}/{action}/'
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(
+                    model.objects.filter(user=self.user).count(), 1)
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assertEqual(self.client.delete(url).status_code, 400)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertEqual(self.recipe.in_carts_count, 0)
+
+    def test_missing_recipe(self):
+        response = self.client.post('/api/recipes/0/favorite/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_short_response(self):
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.pk}/favorite/?short=true')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(response.data),
+            {'id', 'name', 'image', 'image_thumbnail', 'cooking_time'})
+
+    def test_subscribe(self):
+        author = self.authors[1]
+        url = f'/api/users/{author.pk}/subscribe/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes_count'], 1)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(
+            self.client.post(
+                f'/api/users/{self.user.pk}/subscribe/').status_code, 400)
+        self.assertEqual(
+            self.client.post('/api/users/0/subscribe/').status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+
+
+class PantrySearchTest(RecipeTestCase):
+    '''Поиск по имеющимся ингредиентам совпадает с полным перебором'''
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = []
+        for number in range(14):
+            recipe = Recipe.objects.create(
+                author=cls.authors[0], name=f'Рецепт {number}',
+                text='Описание', cooking_time=5,
+                image='recipes_image/test.png')
+            AmountIngredient.objects.bulk_create(
+                AmountIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=1)
+                for index, ingredient in enumerate(cls.ingredients)
+                if (number + index) % 3 == 0 or index == number % 5)
+            cls.recipes.append(recipe)
+        cls.have = [ingredient.pk for ingredient in cls.ingredients[:4]]
+
+    def setUp(self):
+        super().setUp()
+        self.index = PantryIndex()
+        index_patch = patch('api.views.pantry_index', self.index)
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+
+    def get_expected(self):
+        '''Полный перебор: доля и число найденных, затем новые рецепты'''
+        ingredients = defaultdict(set)
+        for recipe_id, ingredient_id in AmountIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].add(ingredient_id)
+        ranked = []
+        for recipe_id, recipe_ingredients in ingredients.items():
+            matched = len(recipe_ingredients & set(self.have))
+            if matched:
+                ranked.append((
+                    matched / len(recipe_ingredients), matched, recipe_id))
+        ranked.sort(reverse=True)
+        return [rank[:2] for rank in ranked], [rank[2] for rank in ranked]
+
+    def get_ids(self, limit):
+        recipe_ids, page = [], 1
+        have = ','.join(map(str, self.have))
+        while True:
+            response = self.client.get(
+                '/api/recipes/by-ingredients/',
+                {'have': have, 'limit': limit, 'page': page})
+            self.assertEqual(response.status_code, 200)
+            recipe_ids += [recipe['id'] for recipe in response.data['results']]
+            if response.data['next'] is None:
+                return recipe_ids, response.data['count']
+            page += 1
+
+    def test_ranking_matches_brute_force(self):
+        groups, expected = self.get_expected()
+        limit = 4
+        self.assertTrue(any(
+            groups[start] == groups[start - 1]
+            for start in range(limit, len(groups), limit)),
+            'ни одна страница не начинается внутри группы')
+        self.assertEqual(self.get_ids(limit), (expected, len(expected)))
+
+    def test_change_is_applied_without_rebuild(self):
+        self.get_ids(100)
+        recipe = self.recipes[0]
+        AmountIngredient.objects.filter(recipe=recipe).delete()
+        AmountIngredient.objects.create(
+            recipe=recipe, ingredient=self.ingredients[0], amount=1)
+        mark_changed(recipe.pk)
+        with patch.object(
+                self.index, 'rebuild', wraps=self.index.rebuild) as rebuild:
+            recipe_ids, _ = self.get_ids(100)
+        rebuild.assert_not_called()
+        self.assertEqual(recipe_ids, self.get_expected()[1])
+        self.assertEqual(recipe_ids[0], recipe.pk)
+
+
+class ReplicaRoutingTest(TestCase):
+    '''Чтение из реплики, закрепление после записи и отказ реплики'''
+
+    def setUp(self):
+        cache.clear()
+        replicas_settings = self.settings(
+            DATABASE_REPLICAS=['replica1'], REPLICA_CHECK_INTERVAL=0)
+        replicas_settings.enable()
+        self.addCleanup(replicas_settings.disable)
+        replicas_patch = patch('config.routers.replicas', ReplicaSet())
+        replicas_patch.start()
+        self.addCleanup(replicas_patch.stop)
+        self.lag = 0.0
+        lag_patch = patch.object(
+            ReplicaSet, 'get_lag', side_effect=lambda alias: self.lag)
+        lag_patch.start()
+        self.addCleanup(lag_patch.stop)
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.aliases = (
+            router.db_for_read(Recipe), router.db_for_read(Token),
+            router.db_for_write(Recipe))
+        return HttpResponse(status=self.status)
+
+    def request(self, method, status=200, token='first'):
+        self.status = status
+        self.middleware(getattr(self.factory, method)(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token}'))
+        return self.aliases
+
+    def test_safe_reads_use_replica(self):
+        self.assertEqual(
+            self.request('get'), ('replica1', 'default', 'default'))
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+    def test_write_pins_client_to_primary(self):
+        self.assertEqual(self.request('post', status=400)[0], 'default')
+        self.assertEqual(self.request('get')[0], 'replica1')
+        self.assertEqual(
+            self.request('post', status=201), ('default',) * 3)
+        self.assertEqual(self.request('get')[0], 'default')
+        self.assertEqual(self.request('get', token='second')[0], 'replica1')
+
+    def test_unhealthy_replica_falls_back(self):
+        for lag in (None, settings.REPLICA_MAX_LAG + 1):
+            with self.subTest(lag=lag):
+                self.lag = lag
+                self.assertEqual(self.request('get')[0], 'default')
+
+
+class RecipeTagIndexTest(TestCase):
+    '''Индекс таблицы связи рецептов и тегов создаётся после migrate'''
+
+    def test_index_exists(self):
+        through = Recipe.tags.through
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, through._meta.db_table)
+        self.assertEqual(
+            constraints['recipe_tag_tag_recipe_idx']['columns'],
+            ['tag_id', 'recipe_id'])
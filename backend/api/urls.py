@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (FoodgramUsersViewSet, IngredintViewSet,
-                    RecipeViewSet, TagViewSet)
+from .views import (CacheStatsView, FoodgramUsersViewSet, IngredintViewSet,
+                    RecipeViewSet, RequestStatsView, TagViewSet)
 
 app_name = 'api'
 
@@ -14,6 +14,9 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'tags', TagViewSet, basename='tags')
 
 urlpatterns = [
+    path('stats/cache/', CacheStatsView.as_view(), name='cache-stats'),
+    path('stats/requests/', RequestStatsView.as_view(),
+         name='request-stats'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken'))
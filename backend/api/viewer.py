@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+
+from api.cache import get_version, invalidate
+from foodgram.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+LOADERS = {
+    'favorites': lambda user: Favorite.objects.filter(
+        user=user).values_list('recipe_id', flat=True),
+    'shopping_cart': lambda user: ShoppingCart.objects.filter(
+        user=user).values_list('recipe_id', flat=True),
+    'following': lambda user: Subscription.objects.filter(
+        user=user).values_list('author_id', flat=True),
+}
+
+
+class ViewerState:
+    '''Избранное, корзина и подписки текущего пользователя.
+
+    Каждое множество id загружается одним запросом при первом обращении
+    и живёт до конца запроса. При VIEWER_STATE_TIMEOUT > 0 все три
+    множества загружаются вместе и хранятся в кэше одной записью, ключ
+    которой содержит версию пользователя. Запись меняет версию, поэтому
+    запрос, прочитавший БД до неё, кладёт множества под старый ключ,
+    который уже никто не читает. Требует общего бэкенда кэша.
+    '''
+
+    def __init__(self, user):
+        self.user = user
+        self.ids = {}
+        if self.cached:
+            self.cache_key = self.get_cache_key(user.pk)
+            self.ids = cache.get(self.cache_key) or {}
+
+    @property
+    def cached(self):
+        return (not self.user.is_anonymous
+                and settings.VIEWER_STATE_TIMEOUT > 0)
+
+    @staticmethod
+    def get_cache_key(user_id):
+        namespace = f'viewer:{user_id}'
+        return f'{namespace}:{get_version(namespace)}'
+
+    @classmethod
+    def invalidate(cls, user):
+        if settings.VIEWER_STATE_TIMEOUT > 0:
+            invalidate(f'viewer:{user.pk}')
+
+    def get_ids(self, name):
+        if self.user.is_anonymous:
+            return frozenset()
+        if name not in self.ids:
+            if not self.cached:
+                self.ids[name] = frozenset(LOADERS[name](self.user))
+                return self.ids[name]
+            self.ids = {
+                name: frozenset(load(self.user))
+                for name, load in LOADERS.items()}
+            cache.set(
+                self.cache_key, self.ids, settings.VIEWER_STATE_TIMEOUT)
+        return self.ids[name]
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.get_ids('favorites')
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.get_ids('shopping_cart')
+
+    def is_subscribed(self, author_id):
+        return author_id in self.get_ids('following')
+
+
+def get_viewer(context):
+    '''Состояние пользователя из контекста сериалайзера'''
+    if 'viewer' not in context:
+        request = context.get('request')
+        context['viewer'] = ViewerState(
+            request.user if request else AnonymousUser())
+    return context['viewer']
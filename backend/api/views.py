@@ -1,23 +1,42 @@
 import django_filters.rest_framework
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch,
+                              Subquery, Value)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import BooleanField
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from api.autocomplete import IngredientSearchMixin
+from api.cache import CachedResponseMixin, get_stats, get_version
+from api.cart import cart_catalog
+from api.conditional import ConditionalResponseMixin
 from api.filters import IngredientsFilter, RecipesFilter
-from api.pagination import CustomPagination
+from api.fragments import KEY_FIELDS, recipe_fragments
+from api.pagination import (CustomPagination, FeedPagination,
+                            RecipePagination)
+from api.pantry import pantry_index
 from api.permissions import AuthorPermission
-from api.serializers import (CustomUserSerializer, FavouriteSerializer,
-                             FollowSerializer, GetMyRecipeSerializer,
-                             MyIngredientSerializer, MyTagSerializer,
-                             PostMyRecipeSerializer, ShoppingCartSerializer)
-from foodgram.models import (Favorite, Ingredient, Recipe, AmountIngredient,
-                             ShoppingCart, Tag)
+from api.relations import add_relation
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                           ShoppingListTxtRenderer)
+from api.representation import ValuesListMixin
+from api.serializers import (CustomUserSerializer, FollowSerializer,
+                             GetMyRecipeSerializer, MyIngredientSerializer,
+                             MyTagSerializer, PostMyRecipeSerializer,
+                             RecipeAbbSerializer)
+from api.stats import collector
+from api.viewer import ViewerState
+from config.postgresql.base import get_pool_stats
+from foodgram.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from users.models import Subscription, User
 
 
@@ -27,6 +46,12 @@ class FoodgramUsersViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
+    lookup_value_regex = r'\d+'
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['viewer'] = ViewerState(self.request.user)
+        return context
 
     @action(
         detail=True,
@@ -36,21 +61,33 @@ class FoodgramUsersViewSet(UserViewSet):
         url_name='subscribe',)
     def follow(self, request, id):
         '''Подписка/отписка'''
-        author = get_object_or_404(User, id=id)
         if request.method == 'POST':
-            serializer = FollowSerializer(author,
-                                          data=request.data,
-                                          context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            Subscription.objects.create(user=request.user, author=author)
+            if not add_relation(
+                    Subscription, 'author', id, exclude_id=request.user.pk,
+                    user_id=request.user.pk):
+                author = get_object_or_404(User, id=id)
+                raise ValidationError({'errors': (
+                    'Нельзя подписаться на себя' if author == request.user
+                    else 'Вы уже подписаны на этого автора')})
+            ViewerState.invalidate(request.user)
+            User.objects.filter(pk=id).update(
+                followers_count=F('followers_count') + 1)
+            serializer = FollowSerializer(
+                User.objects.annotate(
+                    is_subscribed=Value(True),
+                    recipes_total=Count('recipes'),
+                ).get(pk=id),
+                context=self.get_serializer_context())
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            get_object_or_404(
-                Subscription,
-                user=request.user,
-                author=author).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(serializer.data, status=status.HTTP_404_NOT_FOUND)
+        deleted, _ = Subscription.objects.filter(
+            user=request.user, author_id=id).delete()
+        if not deleted:
+            raise ValidationError(
+                {'errors': 'Вы не подписаны на этого автора'})
+        ViewerState.invalidate(request.user)
+        User.objects.filter(pk=id, followers_count__gt=0).update(
+            followers_count=F('followers_count') - 1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
@@ -60,48 +97,132 @@ class FoodgramUsersViewSet(UserViewSet):
         url_name='subscriptions',)
     def follows(self, request):
         '''Список подписок'''
-        user = request.user
-        queryset = User.objects.filter(following__user=user)
+        recipes = Recipe.objects.all()
+        recipes_limit = FollowSerializer.get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]))
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            is_subscribed=Value(True),
+            recipes_total=Count('recipes'),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        ).order_by('id')
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             pages,
             many=True,
-            context={'request': request},
+            context=self.get_serializer_context(),
         )
         return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalResponseMixin, ModelViewSet):
     '''Вьюсет для рецептов'''
 
     queryset = Recipe.objects.all()
     serializer_class = None
     permission_classes = (AuthorPermission,)
-    filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
+    filter_backends = (django_filters.rest_framework.DjangoFilterBackend,
+                       OrderingFilter)
     filterset_class = RecipesFilter
-    pagination_class = CustomPagination
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+    pagination_class = RecipePagination
+    lookup_value_regex = r'\d+'
+    counters = {
+        Favorite: 'favorites_count',
+        ShoppingCart: 'in_carts_count',
+    }
+    errors = {
+        Favorite: ('Рецепт уже добавлен в Избранное',
+                   'Рецепта нет в Избранном'),
+        ShoppingCart: ('Рецепт уже в корзине', 'Рецепта нет в корзине'),
+    }
+
+    def get_etag_data(self, request):
+        if self.action != 'retrieve':
+            return None
+        queryset = Recipe.objects.with_user_flags(request.user)
+        if request.user.is_anonymous:
+            queryset = queryset.annotate(is_subscribed=Value(False))
+        else:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=request.user, author=OuterRef('author'))))
+        state = queryset.filter(pk=self.kwargs['pk']).values_list(
+            'updated_at', 'is_favorited', 'is_in_shopping_cart',
+            'is_subscribed', 'author__username', 'author__first_name',
+            'author__last_name', 'author__email').first()
+        if state is None:
+            return None
+        return f'{state}:{get_version("tags")}:{get_version("ingredients")}'
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['viewer'] = ViewerState(self.request.user)
+        return context
+
+    def get_queryset(self):
+        if self.request.method not in SAFE_METHODS:
+            return Recipe.objects.all()
+        return self.get_read_queryset()
+
+    @staticmethod
+    def get_read_queryset():
+        if recipe_fragments.enabled:
+            return Recipe.objects.only(*KEY_FIELDS)
+        return Recipe.objects.with_related()
 
     def get_serializer_class(self):
         if self.request.method not in SAFE_METHODS:
             return PostMyRecipeSerializer
         return GetMyRecipeSerializer
 
-    @staticmethod
-    def post_action(model=None, serializer=None, request=None, pk=None):
-        serializer = serializer(
-            data={'user': request.user.id, 'recipe': pk},
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+    def perform_destroy(self, instance):
+        instance.delete()
+        User.objects.filter(
+            pk=instance.author_id, recipes_count__gt=0
+        ).update(recipes_count=F('recipes_count') - 1)
+
+    @classmethod
+    def update_counter(cls, model, pk, delta):
+        field = cls.counters[model]
+        queryset = Recipe.objects.filter(pk=pk)
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**{field: F(field) + delta})
+
+    @classmethod
+    def post_action(cls, model=None, request=None, pk=None):
+        '''Добавление одним запросом; ?short=true - краткий ответ'''
+        short = BooleanField().run_validation(
+            request.query_params.get('short', False))
+        if not add_relation(model, 'recipe', pk, user_id=request.user.pk):
+            get_object_or_404(Recipe, pk=pk)
+            raise ValidationError({'errors': cls.errors[model][0]})
+        ViewerState.invalidate(request.user)
+        cls.update_counter(model, pk, 1)
+        context = {'request': request}
+        if short:
+            serializer = RecipeAbbSerializer(
+                Recipe.objects.get(pk=pk), context=context)
+        else:
+            serializer = GetMyRecipeSerializer(
+                cls.get_read_queryset().get(pk=pk), context=context)
         return Response(serializer.data, status.HTTP_201_CREATED)
 
-    @staticmethod
-    def delete_action(model=None, request=None, pk=None):
-        get_object_or_404(
-            model,
-            recipe__id=pk,
-            user=get_object_or_404(User, id=request.user.id)).delete()
+    @classmethod
+    def delete_action(cls, model=None, request=None, pk=None):
+        deleted, _ = model.objects.filter(
+            user=request.user, recipe_id=pk).delete()
+        if not deleted:
+            raise ValidationError({'errors': cls.errors[model][1]})
+        cls.update_counter(model, pk, -1)
+        ViewerState.invalidate(request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -109,7 +230,7 @@ class RecipeViewSet(ModelViewSet):
         methods=['POST'],
         permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk):
-        return self.post_action(Favorite, FavouriteSerializer, request, pk)
+        return self.post_action(Favorite, request, pk)
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk):
@@ -120,11 +241,7 @@ class RecipeViewSet(ModelViewSet):
         methods=['POST'],
         permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk):
-        return self.post_action(
-            ShoppingCart,
-            ShoppingCartSerializer,
-            request,
-            pk)
+        return self.post_action(ShoppingCart, request, pk)
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk):
@@ -136,52 +253,119 @@ class RecipeViewSet(ModelViewSet):
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=(IsAuthenticated,),)
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,)
+    def feed(self, request):
+        '''Рецепты авторов из подписок, от новых к старым'''
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            author__in=Subquery(
+                Subscription.objects.filter(
+                    user=request.user).values('author_id')))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='by-ingredients',
+        url_name='by_ingredients',)
+    def by_ingredients(self, request):
+        '''Рецепты по доле имеющихся ингредиентов'''
+        try:
+            have = [
+                int(ingredient_id) for ingredient_id
+                in request.query_params.get('have', '').split(',')
+                if ingredient_id]
+        except ValueError:
+            have = None
+        if not have:
+            raise ValidationError(
+                {'have': 'Укажите id ингредиентов через запятую'})
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(
+            pantry_index.search(have), request, view=self)
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in page
+             if recipe_id in recipes],
+            many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(ShoppingListTxtRenderer,
+                          ShoppingListCSVRenderer,
+                          ShoppingListJSONRenderer),)
     def download_shopping_cart(self, request):
-        queryset = AmountIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).order_by('ingredient__name').annotate(amount=Sum('amount'))
-
-        return self.sending(queryset)
-
-    def sending(self, queryset):
-        text_to_print = 'Нужно купить:'
-        for product in queryset:
-
-            text_to_print += (
-                '\n'
-                + str(Ingredient.objects.get(
-                    name=product['ingredient__name']).name)
-                + ' '
-                + str(product['amount'])
-                + ' '
-                + str(Ingredient.objects.get(
-                    name=product['ingredient__name']).measurement_unit))
-
-        response = HttpResponse(text_to_print, content_type='text/plain')
+        return self.sending(
+            cart_catalog.summarize(request.user), request.accepted_renderer)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart/summary',
+        url_name='shopping_cart_summary',)
+    def shopping_cart_summary(self, request):
+        '''Список покупок с единицами, приведёнными к базовым'''
+        return Response(cart_catalog.summarize(request.user))
+
+    @staticmethod
+    def sending(products, renderer):
+        response = StreamingHttpResponse(
+            renderer.stream(products),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}')
         response['Content-Disposition'] = (
-            'attachment; filename=foodgram_products.txt')
+            f'attachment; filename=foodgram_products.{renderer.format}')
 
         return response
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(ConditionalResponseMixin, CachedResponseMixin,
+                 ValuesListMixin, ModelViewSet):
     '''Вьюсет для тегов'''
 
+    cache_namespace = 'tags'
+    cache_control = {'public': True, 'max_age': 60}
     queryset = Tag.objects.all()
     serializer_class = MyTagSerializer
     permission_classes = (AuthorPermission,)
     pagination_class = None
 
 
-class IngredintViewSet(ModelViewSet):
+class IngredintViewSet(ConditionalResponseMixin, CachedResponseMixin,
+                       IngredientSearchMixin, ValuesListMixin, ModelViewSet):
     '''Вьюсет для ингредиентов'''
 
+    cache_namespace = 'ingredients'
+    cache_control = {'public': True, 'max_age': 60}
     queryset = Ingredient.objects.all()
     serializer_class = MyIngredientSerializer
     permission_classes = (AuthorPermission,)
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     pagination_class = None
     filterset_class = IngredientsFilter
+
+
+class CacheStatsView(APIView):
+    '''Счётчики кэша справочников'''
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class RequestStatsView(APIView):
+    '''Метрики запросов по эндпоинтам'''
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({
+            'endpoints': collector.get_report(),
+            'pools': get_pool_stats(),
+        })
@@ -0,0 +1,172 @@
+from collections import Counter, deque
+from threading import Condition, Lock
+from time import monotonic
+
+from django.db.backends.postgresql import base
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+Database = base.Database
+
+pools = {}
+pools_lock = Lock()
+# Переподключения после неудачной проверки постоянных соединений
+reconnects = Counter()
+
+
+class ConnectionPool:
+    '''Пул соединений процесса для потоковых и асинхронных воркеров.
+
+    Открывает не больше max_size соединений; когда все заняты, ждёт
+    освободившееся до timeout секунд. Соединение, простоявшее дольше
+    check_idle секунд, перед выдачей проверяется запросом SELECT 1.
+    '''
+
+    def __init__(self, max_size, timeout, check_idle):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.condition = Condition()
+        self.idle = deque()
+        self.size = 0
+        self.stats = Counter()
+
+    def checkout(self, connect):
+        deadline = monotonic() + self.timeout
+        with self.condition:
+            self.stats['checkouts'] += 1
+            if not self.idle and self.size >= self.max_size:
+                self.stats['waits'] += 1
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise Database.OperationalError(
+                        f'Нет свободных соединений в пуле за {self.timeout} с')
+                self.condition.wait(remaining)
+            if self.idle:
+                connection, returned = self.idle.pop()
+            else:
+                connection, returned = None, None
+                self.size += 1
+        if connection is not None:
+            if self.is_usable(connection, returned):
+                return connection
+            self.stats['reconnects'] += 1
+            self.discard(connection, release=False)
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        self.stats['connects'] += 1
+        return connection
+
+    def checkin(self, connection):
+        try:
+            if (not connection.closed and connection.get_transaction_status()
+                    != TRANSACTION_STATUS_IDLE):
+                connection.rollback()
+            usable = not connection.closed
+        except Database.Error:
+            usable = False
+        if not usable:
+            self.stats['discarded'] += 1
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, monotonic()))
+            self.condition.notify()
+
+    def is_usable(self, connection, returned):
+        if connection.closed:
+            return False
+        if monotonic() - returned < self.check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    def discard(self, connection, release=True):
+        try:
+            connection.close()
+        except Database.Error:
+            pass
+        if release:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+
+    def get_stats(self):
+        with self.condition:
+            return {**self.stats, 'size': self.size, 'idle': len(self.idle)}
+
+
+def get_pool_stats():
+    '''Статистика пулов и переподключений этого процесса'''
+    with pools_lock:
+        stats = {alias: pool.get_stats() for alias, pool in pools.items()}
+    for alias, count in reconnects.items():
+        stats.setdefault(alias, {})['health_check_reconnects'] = count
+    return stats
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''PostgreSQL с проверкой постоянных соединений и пулом.
+
+    CONN_HEALTH_CHECKS: соединение, пережившее запрос (CONN_MAX_AGE > 0),
+    проверяется перед первым запросом к БД в следующем HTTP-запросе.
+    POOL: {'MAX_SIZE', 'TIMEOUT', 'CHECK_IDLE'} - соединения берутся из
+    пула процесса и возвращаются в него вместо закрытия.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_needed = False
+
+    def get_pool(self):
+        config = self.settings_dict.get('POOL')
+        if not config:
+            return None
+        with pools_lock:
+            if self.alias not in pools:
+                pools[self.alias] = ConnectionPool(
+                    config['MAX_SIZE'], config.get('TIMEOUT', 10),
+                    config.get('CHECK_IDLE', 30))
+            return pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.checkout(
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params))
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        pool = self.get_pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        return pool.checkin(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_needed = (
+            self.connection is not None
+            and self.settings_dict.get('CONN_HEALTH_CHECKS', False))
+
+    def ensure_connection(self):
+        if (self.health_check_needed and self.connection is not None
+                and not self.in_atomic_block):
+            self.health_check_needed = False
+            if not self.is_usable():
+                reconnects[self.alias] += 1
+                self.close()
+        super().ensure_connection()
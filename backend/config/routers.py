@@ -0,0 +1,156 @@
+import logging
+from contextvars import ContextVar
+from hashlib import sha256
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики PostgreSQL в секундах; 0, если она догнала мастер
+LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+# Реплика для чтения в текущем запросе; None - основная база
+read_alias = ContextVar('read_alias', default=None)
+
+
+class ReplicaSet:
+    '''Здоровые реплики с их отставанием.
+
+    Проверяются не чаще раза в REPLICA_CHECK_INTERVAL секунд на процесс:
+    недоступная реплика или отставшая больше REPLICA_MAX_LAG исключается
+    до следующей проверки.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.checked = None
+        self.lags = {}
+        self.position = count()
+
+    @staticmethod
+    def get_lag(alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(LAG_SQL)
+                    return float(cursor.fetchone()[0] or 0)
+                cursor.execute('SELECT 1')
+                return 0.0
+        except DatabaseError:
+            logger.warning('Реплика %s недоступна', alias, exc_info=True)
+            connection.close()
+            return None
+
+    def refresh(self):
+        now = monotonic()
+        if (self.checked is not None
+                and now - self.checked < settings.REPLICA_CHECK_INTERVAL):
+            return
+        with self.lock:
+            if (self.checked is not None
+                    and now - self.checked < settings.REPLICA_CHECK_INTERVAL):
+                return
+            lags = {}
+            for alias in settings.DATABASE_REPLICAS:
+                lag = self.get_lag(alias)
+                if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+                    lags[alias] = lag
+            self.lags = lags
+            self.checked = monotonic()
+
+    def choose(self):
+        '''Реплика по REPLICA_SELECTION или None, если здоровых нет'''
+        self.refresh()
+        lags = self.lags
+        if not lags:
+            return None
+        if settings.REPLICA_SELECTION == 'least_lag':
+            return min(lags, key=lags.get)
+        aliases = sorted(lags)
+        return aliases[next(self.position) % len(aliases)]
+
+
+replicas = ReplicaSet()
+
+
+def get_pin_key(request):
+    '''Ключ закрепления за мастером по заголовку авторизации'''
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return f'db:pin:{sha256(authorization.encode()).hexdigest()}'
+
+
+class ReplicaRouter:
+    '''Чтение из реплики, выбранной ReplicaMiddleware, запись - в default.
+
+    Вне HTTP-запросов (команды, фоновые потоки) и без реплик в настройках
+    всё идёт в основную базу. Токены читаются из основной базы, чтобы
+    только что выданный токен сразу работал.
+    '''
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label == 'authtoken.Token':
+            return DEFAULT_DB_ALIAS
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        if settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    '''Направляет чтение безопасных запросов в реплику.
+
+    После успешного изменяющего запроса клиент на REPLICA_PIN_SECONDS
+    закрепляется за основной базой, чтобы видеть свои изменения
+    (избранное, корзина, подписки), пока реплика их не получила.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pin_key = get_pin_key(request)
+        alias = None
+        if request.method in SAFE_METHODS and not (
+                pin_key and cache.get(pin_key)):
+            alias = replicas.choose()
+        token = read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        if (request.method not in SAFE_METHODS and pin_key
+                and response.status_code < 400):
+            cache.set(pin_key, True, settings.REPLICA_PIN_SECONDS)
+        return response
@@ -40,6 +40,8 @@ INSTALLED_APPS += [
 AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
+    'api.stats.RequestStatsMiddleware',
+    'config.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -72,14 +74,26 @@ WSGI_APPLICATION = 'config.wsgi.application'
 ###########################
 # Database
 ###########################
+# Размер пула соединений процесса; 0 - без пула, соединение потока
+# живёт DB_CONN_MAX_AGE секунд и проверяется перед повторным использованием
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default=0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'config.postgresql',
         'NAME': os.getenv('DB_NAME', default='postgres'),
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='localhost'),
-        'PORT': os.getenv('DB_PORT', default=5432)
+        'PORT': os.getenv('DB_PORT', default=5432),
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(
+            os.getenv('DB_CONN_MAX_AGE', default=60)),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'MAX_SIZE': DB_POOL_SIZE,
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'CHECK_IDLE': 30,
+        } if DB_POOL_SIZE else None,
     },
     'extra': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -87,6 +101,74 @@ DATABASES = {
     },
 }
 
+# Реплики только для чтения: хосты PostgreSQL с настройками основной базы
+# или, для локальной проверки, пути к файлам SQLite - через запятую.
+# Закрепление за мастером после записи работает между воркерами только
+# с общим кэшем
+DATABASE_REPLICAS = []
+replica_databases = [
+    {**DATABASES['default'], 'HOST': host.strip(),
+     'OPTIONS': {'connect_timeout': 2}}
+    for host in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+    if host.strip()
+] + [
+    {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path.strip()}
+    for path in os.getenv('DB_REPLICA_SQLITE', default='').split(',')
+    if path.strip()
+]
+for number, replica in enumerate(replica_databases, start=1):
+    DATABASES[f'replica{number}'] = {
+        **replica, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['config.routers.ReplicaRouter']
+# round_robin или least_lag
+REPLICA_SELECTION = os.getenv('REPLICA_SELECTION', default='round_robin')
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', default=10))
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+
+###########################
+# Cache
+###########################
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', default=60 * 60)),
+    },
+}
+
+# Время жизни избранного/корзины/подписок пользователя в кэше между
+# запросами; 0 - только в пределах запроса
+VIEWER_STATE_TIMEOUT = int(os.getenv('VIEWER_STATE_TIMEOUT', default=0))
+
+# Время жизни общей для всех пользователей части рецептов в кэше;
+# 0 - рецепты собираются из БД на каждый запрос
+RECIPE_FRAGMENT_TIMEOUT = int(
+    os.getenv('RECIPE_FRAGMENT_TIMEOUT', default=0))
+
+# Время жизни токена с пользователем в кэше (0 - без кэша; требует общего
+# бэкенда кэша) и в памяти процесса (0 - без неё); отзыв токена виден
+# другим воркерам через AUTH_TOKEN_LOCAL_TIMEOUT секунд
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=0))
+AUTH_TOKEN_LOCAL_TIMEOUT = int(os.getenv('AUTH_TOKEN_LOCAL_TIMEOUT', default=0))
+AUTH_TOKEN_LOCAL_SIZE = int(os.getenv('AUTH_TOKEN_LOCAL_SIZE', default=1024))
+
+# Автодополнение ингредиентов по индексу в памяти вместо запроса к БД
+INGREDIENT_INDEX = os.getenv('INGREDIENT_INDEX', default='True') == 'True'
+
+# Метрики запросов по эндпоинтам (/api/stats/requests/): включение,
+# строка лога на каждый запрос, порог повторов одного SQL для пометки
+# N+1 и период сброса накопленных метрик в кэш в секундах
+REQUEST_STATS = os.getenv('REQUEST_STATS', default='False') == 'True'
+REQUEST_STATS_LOG = os.getenv('REQUEST_STATS_LOG', default='False') == 'True'
+REQUEST_STATS_REPEATS = int(os.getenv('REQUEST_STATS_REPEATS', default=5))
+REQUEST_STATS_FLUSH = int(os.getenv('REQUEST_STATS_FLUSH', default=10))
+
 ###########################
 # DJANGO REST FRAMEWORK
 ###########################
@@ -95,7 +177,11 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 
     'DEFAULT_PARSER_CLASSES': [
@@ -138,6 +224,11 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Максимальный размер изображения рецепта и число потоков для миниатюр
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=5 * 1024 * 1024))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
 #######################
 # DJOSER
 #######################
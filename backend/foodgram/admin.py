@@ -11,7 +11,7 @@ class IngredientInline(TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
     list_filter = ('author', 'name', 'tags')
     inlines = (IngredientInline,)
 
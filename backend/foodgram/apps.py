@@ -1,6 +1,54 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+# Поиск рецептов по тегу начинается со стороны тега; у автоматической
+# таблицы связи есть только уникальный индекс (recipe_id, tag_id)
+RECIPE_TAG_INDEX_SQL = (
+    'CREATE INDEX IF NOT EXISTS recipe_tag_tag_recipe_idx '
+    'ON {table} ({tag}, {recipe})')
+# istartswith в PostgreSQL - UPPER("name"::text) LIKE UPPER(%s): индекс
+# по тому же выражению с text_pattern_ops для подсказок ингредиентов без
+# индекса в памяти
+INGREDIENT_NAME_INDEX_SQL = (
+    'CREATE INDEX IF NOT EXISTS ingredient_name_upper_idx '
+    'ON {table} (UPPER({name}::text) text_pattern_ops)')
+
+
+def create_indexes(using, **kwargs):
+    '''Индексы, которые нельзя описать в Meta моделей.
+
+    Таблица связи рецептов и тегов создаётся автоматически для
+    ManyToManyField, а индекс по выражению с классом операторов есть
+    только в PostgreSQL. Индексы добавляются после migrate; повторный
+    запуск ничего не меняет.
+    '''
+    from django.db import connections
+
+    from foodgram.models import Ingredient, Recipe
+
+    connection = connections[using]
+    tables = connection.introspection.table_names()
+    quote = connection.ops.quote_name
+    statements = []
+    through = Recipe.tags.through
+    if through._meta.db_table in tables:
+        statements.append(RECIPE_TAG_INDEX_SQL.format(
+            table=quote(through._meta.db_table),
+            tag=quote(through._meta.get_field('tag').column),
+            recipe=quote(through._meta.get_field('recipe').column)))
+    if (connection.vendor == 'postgresql'
+            and Ingredient._meta.db_table in tables):
+        statements.append(INGREDIENT_NAME_INDEX_SQL.format(
+            table=quote(Ingredient._meta.db_table),
+            name=quote(Ingredient._meta.get_field('name').column)))
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
 
 
 class FoodgramConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'foodgram'
+
+    def ready(self):
+        post_migrate.connect(create_indexes, sender=self)
@@ -0,0 +1,249 @@
+import base64
+import io
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram.management.commands.seed_benchmark import get_benchmark_users
+from foodgram.models import Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscription
+
+# Размеры рецепта для сценариев создания и изменения
+INGREDIENT_COUNTS = (5, 30, 100)
+
+
+def percentile(values, percent):
+    '''Перцентиль по ближайшему рангу'''
+    values = sorted(values)
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(rank)]
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'), capture_output=True,
+            text=True, check=True, cwd=settings.BASE_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LocalClient:
+    '''Запросы через тестовый клиент DRF с подсчётом SQL'''
+
+    def __init__(self, token):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+
+    def request(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            start = perf_counter()
+            response = getattr(self.client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = perf_counter() - start
+        return response.status_code, elapsed, len(queries)
+
+
+class RemoteClient:
+    '''Запросы к запущенному серверу (gunicorn); SQL не считается'''
+
+    def __init__(self, token, base_url):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, url, data=None):
+        request = Request(
+            self.base_url + url, method=method.upper(),
+            data=json.dumps(data).encode() if data is not None else None,
+            headers={'Authorization': f'Token {self.token}',
+                     'Content-Type': 'application/json'})
+        start = perf_counter()
+        try:
+            with urlopen(request) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        return status, perf_counter() - start, None
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку и число SQL-запросов ключевых эндпоинтов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Замеряемых запросов на сценарий')
+        parser.add_argument(
+            '--warmup', type=int, default=5, help='Прогревочных запросов')
+        parser.add_argument(
+            '--base-url',
+            help='Адрес запущенного сервера вместо тестового клиента')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего запуска для сравнения')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля')
+        user = get_benchmark_users().filter(
+            pk__in=ShoppingCart.objects.values('user'),
+        ).filter(pk__in=Subscription.objects.values('user')).first()
+        if user is None:
+            raise CommandError('Нет данных, сначала запустите seed_benchmark')
+        token, _ = Token.objects.get_or_create(user=user)
+        if options['base_url']:
+            client = RemoteClient(token.key, options['base_url'])
+        else:
+            client = LocalClient(token.key)
+        results = {}
+        with override_settings(
+                ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver']):
+            for name, method, url, data in self.get_scenarios(user):
+                results[name] = self.run_scenario(
+                    client, method, url, data, options)
+                self.stdout.write(self.format_result(name, results[name]))
+        report = {
+            'revision': get_revision(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'client': 'remote' if options['base_url'] else 'local',
+            'requests': options['requests'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    @staticmethod
+    def get_scenarios(user):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        own_recipe = Recipe.objects.filter(author=user).first()
+        tag = Tag.objects.first()
+        ingredients = list(
+            Ingredient.objects.order_by('pk')[:max(INGREDIENT_COUNTS)])
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), '#49B64E').save(buffer, 'PNG')
+        image = base64.b64encode(buffer.getvalue()).decode()
+
+        def get_amounts(count):
+            return [
+                {'id': ingredient.pk, 'amount': number + 1}
+                for number, ingredient in enumerate(ingredients[:count])]
+
+        def get_recipe(count):
+            return {
+                'name': 'Тестовый рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'tags': [tag.pk],
+                'ingredients': get_amounts(count),
+                'image': f'data:image/png;base64,{image}',
+            }
+
+        scenarios = [
+            ('recipes_list', 'get', '/api/recipes/', None),
+            ('recipes_list_filtered', 'get',
+             f'/api/recipes/?tags={tag.slug}&is_favorited=1', None),
+            ('recipe_detail', 'get', f'/api/recipes/{recipe.pk}/', None),
+            ('recipes_search', 'get', '/api/recipes/?' + urlencode(
+                {'search': recipe.name.split()[0]}), None),
+            ('subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', None),
+            ('download_shopping_cart', 'get',
+             '/api/recipes/download_shopping_cart/', None),
+            ('ingredient_autocomplete', 'get',
+             f'/api/ingredients/?name={ingredients[0].name[:3]}', None),
+            ('recipe_create', 'post', '/api/recipes/', get_recipe(1)),
+        ]
+        for count in INGREDIENT_COUNTS:
+            if count > len(ingredients):
+                continue
+            scenarios.append((
+                f'recipe_create_{count}', 'post', '/api/recipes/',
+                get_recipe(count)))
+            if own_recipe is not None:
+                scenarios.append((
+                    f'recipe_update_{count}', 'patch',
+                    f'/api/recipes/{own_recipe.pk}/',
+                    {'tags': [tag.pk], 'ingredients': get_amounts(count)}))
+        return scenarios
+
+    def run_scenario(self, client, method, url, data, options):
+        timings, queries, errors = [], [], 0
+        for number in range(options['warmup'] + options['requests']):
+            if method == 'get':
+                status, elapsed, count = client.request(method, url)
+            else:
+                status, elapsed, count = self.request_rolled_back(
+                    client, method, url, data)
+            if number < options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            errors += status >= 400
+            if count is not None:
+                queries.append(count)
+        return {
+            'errors': errors,
+            'rps': round(len(timings) / sum(timings) * 1000, 1),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'queries': max(queries) if queries else None,
+        }
+
+    @staticmethod
+    def request_rolled_back(client, method, url, data):
+        '''Запись без следов в базе; удалённый сервер изменения сохранит'''
+        if isinstance(client, RemoteClient):
+            return client.request(method, url, data)
+        last = Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        with transaction.atomic():
+            status, elapsed, count = client.request(method, url, data)
+            images = list(Recipe.objects.filter(
+                pk__gt=last).values_list('image', flat=True))
+            transaction.set_rollback(True)
+        for image in images:
+            default_storage.delete(image)
+        return status, elapsed, count
+
+    @staticmethod
+    def format_result(name, result):
+        return (f'{name:<26} p50 {result["p50_ms"]:>8} мс  '
+                f'p95 {result["p95_ms"]:>8} мс  p99 {result["p99_ms"]:>8} мс  '
+                f'{result["rps"]:>7} rps  SQL {result["queries"]}  '
+                f'ошибок {result["errors"]}')
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)
+        self.stdout.write(f'Сравнение с {previous.get("revision")}:')
+        for name, result in results.items():
+            old = previous['results'].get(name)
+            if old is None:
+                continue
+            change = (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+            style = self.style.ERROR if change > 10 else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{name:<26} p95 {old["p95_ms"]} -> {result["p95_ms"]} мс '
+                f'({change:+.0f}%), SQL {old["queries"]} -> '
+                f'{result["queries"]}'))
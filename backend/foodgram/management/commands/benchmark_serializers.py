@@ -0,0 +1,74 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import FastJSONRenderer
+from api.representation import CompiledRepresentationMixin
+from api.serializers import (GetMyRecipeSerializer, MyIngredientSerializer,
+                             MyTagSerializer, RecipeAbbSerializer)
+from foodgram.models import Ingredient, Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость сериализации и рендеринга JSON '
+            'обычным путём DRF и ускоренным')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=1000, help='Строк в одном прогоне')
+        parser.add_argument(
+            '--repeat', type=int, default=5, help='Число прогонов')
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        if rows < 1 or repeat < 1:
+            raise CommandError('--rows и --repeat должны быть больше нуля')
+        cases = (
+            ('recipe', GetMyRecipeSerializer,
+             lambda: Recipe.objects.with_related()[:rows], None),
+            ('recipe_short', RecipeAbbSerializer,
+             lambda: Recipe.objects.all()[:rows], None),
+            ('tag', MyTagSerializer, lambda: Tag.objects.all()[:rows],
+             MyTagSerializer.Meta.fields),
+            ('ingredient', MyIngredientSerializer,
+             lambda: Ingredient.objects.all()[:rows],
+             MyIngredientSerializer.Meta.fields),
+        )
+        for name, serializer, get_queryset, values in cases:
+            baseline = self.measure(
+                serializer, get_queryset, None, JSONRenderer(), False, repeat)
+            fast = self.measure(
+                serializer, get_queryset, values, FastJSONRenderer(), True,
+                repeat)
+            self.stdout.write(f'{name:<14} ' + '  '.join(
+                f'{stage} {baseline[stage]:>9.0f} -> {fast[stage]:>9.0f}'
+                for stage in baseline) + ' строк/с')
+
+    @staticmethod
+    def measure(serializer, get_queryset, values, renderer, compiled, repeat):
+        '''Строк в секунду на выборке, сериализации и рендеринге'''
+        timings = {'fetch': 0.0, 'serialize': 0.0, 'render': 0.0}
+        count = 0
+        CompiledRepresentationMixin.compiled = compiled
+        try:
+            for _ in range(repeat):
+                start = perf_counter()
+                queryset = get_queryset()
+                if values:
+                    queryset = queryset.values(*values)
+                instances = list(queryset)
+                serialized = perf_counter()
+                data = serializer(instances, many=True, context={}).data
+                rendered = perf_counter()
+                renderer.render(data)
+                finished = perf_counter()
+                timings['fetch'] += serialized - start
+                timings['serialize'] += rendered - serialized
+                timings['render'] += finished - rendered
+                count += len(instances)
+        finally:
+            CompiledRepresentationMixin.compiled = True
+        return {
+            stage: count / elapsed if elapsed else 0
+            for stage, elapsed in timings.items()}
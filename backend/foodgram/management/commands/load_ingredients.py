@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import invalidate
+from foodgram.models import Ingredient
+
+CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n,'
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if not row or row == ['name', 'measurement_unit']:
+            continue
+        yield {'name': row[0], 'measurement_unit': row[1]}
+
+
+def read_json(file):
+    '''Построчно разбирает JSON-массив, не загружая файл целиком'''
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл JSON оборван или повреждён')
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item.get('fields', item)
+        if position > CHUNK_SIZE:
+            buffer, position = buffer[position:], 0
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV/JSON файлов пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы CSV или JSON')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной вставке')
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='Обновлять единицы измерения существующих ингредиентов')
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL')
+
+    def handle(self, *args, **options):
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy'])
+        write = self.write_copy if use_copy else self.write_bulk
+        seen = set()
+        started, total = monotonic(), 0
+        with transaction.atomic():
+            for path in options['paths']:
+                rows = self.unique_rows(path, seen)
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    write(batch, options['upsert'])
+                    total += len(batch)
+        invalidate('ingredients')
+        elapsed = monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {total} ингредиентов за {elapsed:.2f} с '
+            f'({total / elapsed if elapsed else total:.0f} строк/с)'))
+
+    @staticmethod
+    def unique_rows(path, seen):
+        extension = os.path.splitext(path)[1].lstrip('.').lower()
+        if extension not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        with open(path, encoding='utf-8', newline='') as file:
+            for item in READERS[extension](file):
+                name = item['name'].strip()
+                if not name or name in seen:
+                    continue
+                seen.add(name)
+                yield name, item['measurement_unit'].strip()
+
+    @staticmethod
+    def write_bulk(batch, upsert):
+        if upsert:
+            existing = Ingredient.objects.in_bulk(
+                [name for name, _ in batch], field_name='name')
+            changed = []
+            for name, measurement_unit in batch:
+                ingredient = existing.get(name)
+                if (ingredient is not None
+                        and ingredient.measurement_unit != measurement_unit):
+                    ingredient.measurement_unit = measurement_unit
+                    changed.append(ingredient)
+            Ingredient.objects.bulk_update(changed, ('measurement_unit',))
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in batch),
+            ignore_conflicts=True)
+
+    @staticmethod
+    def write_copy(batch, upsert):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        on_conflict = (
+            'UPDATE SET measurement_unit = EXCLUDED.measurement_unit'
+            if upsert else 'NOTHING')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_import '
+                '(name varchar(255), measurement_unit varchar(32)) '
+                'ON COMMIT DROP')
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                f'ON CONFLICT (name) DO {on_conflict}')
+            cursor.execute('TRUNCATE ingredient_import')
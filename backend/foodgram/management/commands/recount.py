@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from foodgram.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+
+def count_of(queryset, field):
+    '''Подзапрос с числом строк queryset для внешнего объекта'''
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, корзин, подписчиков и рецептов'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.update(
+            favorites_count=count_of(Favorite.objects, 'recipe'),
+            in_carts_count=count_of(ShoppingCart.objects, 'recipe'),
+        )
+        users = User.objects.update(
+            followers_count=count_of(Subscription.objects, 'author'),
+            recipes_count=count_of(Recipe.objects, 'author'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}'))
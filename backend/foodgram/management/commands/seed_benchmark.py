@@ -0,0 +1,178 @@
+import io
+import random
+from time import monotonic
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.cache import invalidate
+from foodgram.models import (AmountIngredient, Favorite, Ingredient, Recipe,
+                             ShoppingCart, Tag)
+from foodgram.search import update_search_vector
+from users.models import Subscription, User
+
+PREFIX = 'bench'
+# Зарезервированный домен (RFC 2606): по нему отличаются тестовые
+# пользователи, настоящие адреса в нём невозможны
+EMAIL_DOMAIN = 'benchmark.invalid'
+PASSWORD = 'bench-password'
+UNITS = ('г', 'кг', 'мл', 'л', 'шт', 'ст. л.', 'ч. л.')
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'омлет', 'плов',
+    'борщ', 'блины', 'паста', 'котлеты', 'соус', 'десерт', 'хлеб',
+)
+
+
+def get_benchmark_users():
+    '''Пользователи, созданные seed_benchmark'''
+    return User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу данными для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=200, help='Количество авторов')
+        parser.add_argument(
+            '--recipes', type=int, default=10,
+            help='Рецептов на пользователя')
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Минимум ингредиентов в справочнике')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Избранных рецептов на пользователя')
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Рецептов в корзине на пользователя')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Подписок на пользователя')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить данные предыдущего запуска')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = monotonic()
+        benchmark_users = get_benchmark_users()
+        if benchmark_users.exists():
+            if not options['clear']:
+                raise CommandError(
+                    'Данные уже созданы, используйте --clear для пересоздания')
+            benchmark_users.delete()
+        with transaction.atomic():
+            ingredients = self.create_ingredients(options['ingredients'])
+            tags = self.create_tags()
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                users, options['recipes'], ingredients, tags)
+            self.create_relations(users, recipes, options)
+        call_command('recount', stdout=io.StringIO())
+        update_search_vector()
+        invalidate('ingredients')
+        invalidate('tags')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)} '
+            f'за {monotonic() - started:.1f} с'))
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def create_ingredients(self, count):
+        missing = count - Ingredient.objects.count()
+        if missing > 0:
+            self.bulk_create(Ingredient, [
+                Ingredient(
+                    name=f'{PREFIX} ингредиент {number}',
+                    measurement_unit=self.random.choice(UNITS))
+                for number in range(missing)])
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def create_tags(self):
+        if not Tag.objects.exists():
+            self.bulk_create(Tag, [
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in (
+                    ('Завтрак', '#E26C2D', 'breakfast'),
+                    ('Обед', '#49B64E', 'lunch'),
+                    ('Ужин', '#8775D2', 'dinner'))])
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        self.bulk_create(User, [
+            User(
+                username=f'{PREFIX}{number}',
+                email=f'{PREFIX}{number}@{EMAIL_DOMAIN}',
+                first_name='Автор', last_name=str(number),
+                password=password)
+            for number in range(count)])
+        return list(get_benchmark_users().values_list('pk', flat=True))
+
+    def create_image(self):
+        name = 'recipes_image/bench.jpg'
+        if default_storage.exists(name):
+            return name
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'JPEG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def create_recipes(self, users, count, ingredients, tags):
+        image = self.create_image()
+        self.bulk_create(Recipe, [
+            Recipe(
+                author_id=author_id,
+                name=f'{self.random.choice(WORDS).capitalize()} {number}',
+                text=' '.join(self.random.choices(WORDS, k=30)),
+                cooking_time=self.random.randint(5, 120),
+                image=image)
+            for author_id in users for number in range(count)])
+        recipes = list(Recipe.objects.filter(
+            author_id__in=users).values_list('pk', flat=True))
+        amounts, recipe_tags = [], []
+        for recipe_id in recipes:
+            amounts += [
+                AmountIngredient(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500))
+                for ingredient_id in self.random.sample(
+                    ingredients, min(len(ingredients),
+                                     self.random.randint(3, 12)))]
+            recipe_tags += [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in self.random.sample(
+                    tags, self.random.randint(1, len(tags)))]
+        self.bulk_create(AmountIngredient, amounts)
+        self.bulk_create(Recipe.tags.through, recipe_tags)
+        return recipes
+
+    def create_relations(self, users, recipes, options):
+        favorites, carts, subscriptions = [], [], []
+        for user_id in users:
+            favorites += [
+                Favorite(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(
+                    recipes, min(len(recipes), options['favorites']))]
+            carts += [
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(
+                    recipes, min(len(recipes), options['cart']))]
+            subscriptions += [
+                Subscription(user_id=user_id, author_id=author_id)
+                for author_id in self.random.sample(
+                    users, min(len(users), options['subscriptions'] + 1))
+                if author_id != user_id][:options['subscriptions']]
+        self.bulk_create(Favorite, favorites)
+        self.bulk_create(ShoppingCart, carts)
+        self.bulk_create(Subscription, subscriptions)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from foodgram.search import update_search_vector
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы всех рецептов (PostgreSQL)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {update_search_vector()}'))
@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (Exists, OuterRef, Prefetch, UniqueConstraint,
+                              Value)
 
 User = get_user_model()
 
@@ -33,6 +36,33 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        '''Признаки «в избранном» и «в корзине» для пользователя'''
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def with_related(self):
+        '''Все данные для чтения рецептов за постоянное число запросов'''
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'in_recipes',
+                queryset=AmountIngredient.objects.select_related(
+                    'ingredient')),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, models.CASCADE, 'recipes',
@@ -43,6 +73,8 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         'Дата публикации', auto_now_add=True, db_index=True
     )
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    search_vector = SearchVectorField('Поисковый вектор', null=True)
     ingredients = models.ManyToManyField(
         Ingredient,
         'ingredients',
@@ -56,11 +88,30 @@ class Recipe(models.Model):
         'Время приготовления (в минутах)'
     )
     image = models.ImageField('Изображение', upload_to='recipes_image/')
+    image_thumbnail = models.ImageField(
+        'Миниатюра', upload_to='recipes_image/thumbnails/', blank=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В корзинах', default=0, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'),
+            GinIndex(fields=('search_vector',), name='recipe_search_idx'),
+        )
 
     def __str__(self) -> str:
         return self.name
@@ -0,0 +1,36 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+
+from foodgram.models import AmountIngredient, Recipe
+
+SEARCH_CONFIG = 'russian'
+
+
+def search_supported(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def update_search_vector(recipe_ids=None):
+    '''Пересчитывает поисковый вектор рецептов одним UPDATE.
+
+    Название весит больше описания, описание - больше ингредиентов.
+    Без recipe_ids пересчитываются все рецепты. Только для PostgreSQL.
+    '''
+    recipes = Recipe.objects.all()
+    if not search_supported(recipes):
+        return 0
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    ingredient_names = AmountIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(
+            Subquery(ingredient_names), weight='C', config=SEARCH_CONFIG)
+    ))
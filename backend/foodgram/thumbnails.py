@@ -0,0 +1,52 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, features
+
+from foodgram.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (480, 480)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='thumbnails')
+
+
+def make_thumbnail(recipe_id):
+    '''Сохраняет уменьшенную копию изображения рецепта в WebP или JPEG'''
+    try:
+        recipe = Recipe.objects.only('image').get(pk=recipe_id)
+        if features.check('webp'):
+            image_format, extension = 'WEBP', 'webp'
+        else:
+            image_format, extension = 'JPEG', 'jpg'
+        with recipe.image.open('rb') as file, Image.open(file) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, quality=80)
+        name = os.path.splitext(os.path.basename(recipe.image.name))[0]
+        recipe.image_thumbnail.save(
+            f'{name}.{extension}', ContentFile(buffer.getvalue()), save=False)
+        Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+            image_thumbnail=recipe.image_thumbnail.name,
+            updated_at=timezone.now())
+    except Recipe.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception('Не удалось создать миниатюру рецепта %s', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_thumbnail(recipe_id):
+    '''Ставит создание миниатюры в очередь фоновых потоков'''
+    executor.submit(make_thumbnail, recipe_id)
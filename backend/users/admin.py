@@ -5,7 +5,8 @@ from users.models import Subscription, User
 
 @admin.register(User)
 class UsersAdmin(admin.ModelAdmin):
-    list_display = ('username', 'full_name', 'email')
+    list_display = ('username', 'full_name', 'email',
+                    'followers_count', 'recipes_count')
     list_filter = ('email', 'username',)
     ordering = ('pk',)
 
@@ -2,6 +2,9 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.db.models import F, Q, UniqueConstraint
 
+# Меняются только запросами с F() и командой recount
+COUNTER_FIELDS = frozenset(('followers_count', 'recipes_count'))
+
 
 class User(AbstractUser):
     username = models.CharField(
@@ -13,11 +16,30 @@ class User(AbstractUser):
         unique=True,
         help_text='Обязательное поле'
     )
+    followers_count = models.PositiveIntegerField(
+        'Подписчики', default=0, editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Рецепты', default=0, editable=False
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
 
+    def save(self, *args, update_fields=None, **kwargs):
+        '''Полное сохранение существующего пользователя не пишет счётчики.
+
+        Иначе сохранение профиля затирает значения, увеличенные другими
+        запросами после загрузки пользователя.
+        '''
+        if update_fields is None and not self._state.adding:
+            skipped = COUNTER_FIELDS | self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
     @property
     def full_name(self):
         return f'{self.first_name} {self.last_name}'